@@ -1,14 +1,129 @@
 import sys
+from collections import OrderedDict
+from PyQt5.QtCore import QObject, QThread, QTimer, pyqtSignal, pyqtSlot
 from PyQt5.QtWidgets import QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit, \
     QPushButton, QFileDialog, QSlider, QCheckBox
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
-import matplotlib.pyplot as plt
 import numpy as np
-import wave
 import pyqtgraph as pg
 
+sys.path.append('..')
+
+from common.envelope import EnvelopePyramid, decimate_peaks
+from common.fft_backend import get_backend
+from common.wav_io import WavMemmap
+
+
+class SpectrumCache:
+    """Least recently used cache of computed spectra, keyed by section start and width."""
+
+    def __init__(self, max_bytes=64 * 2 ** 20):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+        return entry
+
+    def put(self, key, entry):
+        if key in self.entries:
+            return
+        self.entries[key] = entry
+        self.size += sum(array.nbytes for array in entry)
+
+        # Drop the least recently used spectra until the cache fits again
+        while self.size > self.max_bytes and len(self.entries) > 1:
+            _, dropped = self.entries.popitem(last=False)
+            self.size -= sum(array.nbytes for array in dropped)
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+
+
+class SpectrumWorker(QObject):
+    """Computes the spectra of requested sections on a background thread.
+
+    Requests that were superseded by a newer one before they were started are dropped.
+    """
+
+    finished = pyqtSignal(int, object, object, object, object)
+
+    def __init__(self):
+        super().__init__()
+        self.wav = None
+        self.pyramid = None  # Min/max envelopes of the waveform at several resolutions
+        self.cache = SpectrumCache()  # Spectra of recently shown sections, only used on the worker thread
+        self.latest = 0  # Id of the newest request, set by the GUI thread
+        self.prefetch_enabled = True  # Compute the spectra of neighbouring slider positions afterwards
+        self.single_step = 1
+
+    @pyqtSlot(object)
+    def set_wav(self, wav):
+        self.wav = wav
+        self.cache.clear()
+        self.pyramid = EnvelopePyramid(wav.channel(0))
+
+    @pyqtSlot(int, int, int, int, int, bool)
+    def compute(self, request_id, start_index, end_index, wave_points, fft_points, log_scale):
+        """Compute waveform envelope and spectrum of a request at display resolution for the GUI thread."""
+        if request_id != self.latest or self.wav is None:
+            return
+        # Sections at the end of the file or with a width of 0 have no samples to show
+        if end_index <= start_index:
+            return
+
+        try:
+            # Waveform as min/max envelope with about two values per pixel
+            positions, mins, maxs = self.pyramid.envelope(start_index, end_index, wave_points)
+            wave_x = np.repeat(positions, 2)
+            wave_y = np.column_stack((mins, maxs)).ravel()
+
+            # Spectrum reduced to the peaks of every pixel column, on a logarithmic axis if it is shown that way
+            freq, magnitude = self.spectrum(start_index, end_index)
+            freq, magnitude = decimate_peaks(freq, magnitude, fft_points, log=log_scale)
+
+            self.finished.emit(request_id, wave_x, wave_y, freq, magnitude)
+
+            if self.prefetch_enabled:
+                self.prefetch(request_id, start_index, end_index - start_index)
+
+        except Exception as e:
+            # An exception leaving a slot on the worker thread would abort the application
+            print(f"Error computing plots: {e}")
+
+    def spectrum(self, start_index, end_index):
+        """Return frequencies and magnitude spectrum of a section, computed once per start and width."""
+        # The log scale only changes the display, so it is not part of the key
+        key = (start_index, end_index - start_index)
+        entry = self.cache.get(key)
+        if entry is None:
+            section = self.wav.channel(0)[start_index:end_index]
+            # Real signal, so only the non-negative frequencies are computed and shown
+            magnitude = np.abs(get_backend().rfft(np.asarray(section, dtype=np.float64)))
+            freq = np.fft.rfftfreq(len(section), d=(1.0 / self.wav.sample_rate))
+            entry = (freq, magnitude)
+            self.cache.put(key, entry)
+        return entry
+
+    def prefetch(self, request_id, start_index, sample_width):
+        """Compute the spectra of the positions one step and one page left and right of the slider."""
+        num_samples = len(self.wav)
+        for step in (self.single_step, sample_width):
+            for start in (start_index - step, start_index + step):
+                # Stop as soon as a new request is waiting
+                if request_id != self.latest:
+                    return
+                if 0 <= start < num_samples:
+                    self.spectrum(start, min(start + sample_width, num_samples))
+
 
 class AudioAnalyzer(QMainWindow):
+    request_compute = pyqtSignal(int, int, int, int, int, bool)
+    request_file = pyqtSignal(object)
+
     def __init__(self):
         super().__init__(None)
         self.setWindowTitle("Audio Analyzer")
@@ -21,9 +136,32 @@ class AudioAnalyzer(QMainWindow):
         self.sample_width_input = QLineEdit()
         self.sample_width_input.setText("1000")  # Default sample width
         self.plot_fft = pg.PlotWidget()
-        self.canvas = FigureCanvas(plt.figure())  # Matplotlib canvas
+        self.plot_wave = pg.PlotWidget()  # Waveform of the section
+        self.plot_wave.setLabel('bottom', 'Sample Index')
+        self.plot_wave.setLabel('left', 'Amplitude')
+
+        # Plot items are created once and only get new data afterwards
+        self.fft_curve = self.plot_fft.plot(pen='g')
+        self.wave_curve = self.plot_wave.plot(pen='g')
         self.slider = QSlider()
         self.log_scale_checkbox = QCheckBox("Logarithmic Scale")
+        self.wav = None  # Memory-mapped WAV file, opened once per file
+        self.request_id = 0  # Id of the newest plot request, older results are not drawn
+
+        # Background worker for the Fourier transformations
+        self.worker_thread = QThread(self)
+        self.worker = SpectrumWorker()
+        self.worker.moveToThread(self.worker_thread)
+        self.request_compute.connect(self.worker.compute)
+        self.request_file.connect(self.worker.set_wav)
+        self.worker.finished.connect(self.draw_plots)
+        self.worker_thread.start()
+
+        # Changes in quick succession are collected, only the last one is computed
+        self.debounce_timer = QTimer(self)
+        self.debounce_timer.setSingleShot(True)
+        self.debounce_timer.setInterval(15)
+        self.debounce_timer.timeout.connect(self.submit_request)
 
         # Layouts
         central_widget = QWidget(self)
@@ -46,7 +184,7 @@ class AudioAnalyzer(QMainWindow):
         main_layout.addLayout(plot_layout)
 
         plot_layout.addWidget(self.plot_fft)
-        plot_layout.addWidget(self.canvas)  # Add matplotlib canvas to layout
+        plot_layout.addWidget(self.plot_wave)
 
         # Slider layout
         slider_layout = QHBoxLayout()
@@ -66,7 +204,7 @@ class AudioAnalyzer(QMainWindow):
         self.load_button.clicked.connect(self.select_wav_file)
         self.slider.valueChanged.connect(self.update_plots)
         self.sample_width_input.textChanged.connect(self.update_plots)  # Update plots on sample width change
-        self.log_scale_checkbox.stateChanged.connect(self.update_plots)  # Update plots when checkbox state changes
+        self.log_scale_checkbox.stateChanged.connect(self.update_log_mode)  # Spectra are not recomputed
 
     def select_wav_file(self):
         options = QFileDialog.Options()
@@ -79,58 +217,79 @@ class AudioAnalyzer(QMainWindow):
         filename = self.filename_input.text()
 
         try:
-            with wave.open(filename, 'rb') as wav_file:
-                self.slider.setMaximum(wav_file.getnframes())
-                # Initial plots
-                self.update_plots()
+            # Only the header is parsed, the samples are mapped into memory
+            self.wav = WavMemmap(filename)
+            self.request_file.emit(self.wav)
+            # The last section starts at the last sample
+            self.slider.setMaximum(max(0, len(self.wav) - 1))
+            # Initial plots
+            self.update_plots()
 
         except Exception as e:
             print(f"Error loading WAV file: {e}")
 
     def update_plots(self):
-        filename = self.filename_input.text()
+        # Restart the timer, the request is submitted once the input is quiet for a moment
+        self.debounce_timer.start()
+
+    def submit_request(self):
+        if self.wav is None:
+            return
         try:
-            with wave.open(filename, 'rb') as wav_file:
-                frames = wav_file.readframes(-1)
-                audio_data = np.frombuffer(frames, dtype=np.int16)
+            sample_rate = self.wav.sample_rate
+            sample_width_ms = int(self.sample_width_input.text())
+            sample_width = int(sample_rate * (sample_width_ms / 1000.0))  # Convert ms to samples
 
-                sample_rate = wav_file.getframerate()
-                sample_width_ms = int(self.sample_width_input.text())
-                sample_width = int(sample_rate * (sample_width_ms / 1000.0))  # Convert ms to samples
+            # Calculate number of samples to display
+            num_samples = len(self.wav)
 
-                # Calculate number of samples to display
-                num_samples = len(audio_data)
+            # Calculate start index based on slider value
+            start_index = self.slider.value()
+            end_index = start_index + sample_width
 
-                # Calculate start index based on slider value
-                start_index = self.slider.value()
-                end_index = start_index + sample_width
+            if end_index > num_samples:
+                end_index = num_samples
 
-                if end_index > num_samples:
-                    end_index = num_samples
+            # Hand the request to the worker, requests that were not started yet are superseded
+            self.request_id += 1
+            self.worker.latest = self.request_id
+            self.worker.single_step = self.slider.singleStep()
+            self.request_compute.emit(self.request_id, start_index, end_index,
+                                      max(1, self.plot_wave.width()), max(1, self.plot_fft.width()),
+                                      self.log_scale_checkbox.isChecked())
 
-                # Extract the selected sample width section
-                section = audio_data[start_index:end_index]
+            self.slider.setPageStep(max(1, sample_width))
 
-                # Perform Fourier transformation
-                spectrum = np.fft.fft(section)
-                freq = np.fft.fftfreq(len(section), d=(1.0 / sample_rate))
+        except Exception as e:
+            print(f"Error updating plots: {e}")
 
-                # Update FFT plot
-                self.plot_fft.clear()
-                self.plot_fft.plot(freq, np.abs(spectrum), pen='g')  # Plot absolute values only
-                self.plot_fft.setLogMode(x=self.log_scale_checkbox.isChecked())
+    def draw_plots(self, request_id, wave_x, wave_y, freq, magnitude):
+        # Results of superseded requests are not drawn
+        if request_id != self.request_id:
+            return
+        try:
+            # Update FFT plot
+            self.fft_curve.setData(freq, magnitude)  # Plot absolute values only
+            self.plot_fft.setLogMode(x=self.log_scale_checkbox.isChecked())
 
-                # Update audio visualization plot (matplotlib)
-                self.canvas.figure.clear()  # Clear previous plot
-                ax = self.canvas.figure.add_subplot()
-                ax.plot(np.linspace(start_index, end_index, len(section)), section, color='g')  # Plot audio waveform
-                ax.set_xlabel('Sample Index')
-                ax.set_ylabel('Amplitude')
-                self.canvas.draw()  # Redraw canvas
+            # Update audio visualization plot
+            self.wave_curve.setData(wave_x, wave_y)
 
         except Exception as e:
             print(f"Error updating plots: {e}")
 
+    def update_log_mode(self):
+        self.plot_fft.setLogMode(x=self.log_scale_checkbox.isChecked())
+        # The spectrum is reduced differently for a logarithmic axis, the cached spectra are reused
+        self.update_plots()
+
+    def closeEvent(self, event):
+        # Stop the worker thread before the window is destroyed
+        self.worker.latest = -1
+        self.worker_thread.quit()
+        self.worker_thread.wait()
+        super().closeEvent(event)
+
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
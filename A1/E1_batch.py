@@ -0,0 +1,32 @@
+import os
+import sys
+
+sys.path.append('..')
+
+from common.batch import find_wav_files, process_files
+
+
+def main():
+    source = '../Audios/'  # Directory with WAV files or a manifest with one path per line
+    output_dir = 'results/'  # One result file (mean/std spectrum, top frequencies) per WAV file
+
+    # Parameters for windowing and Fourier transform
+    window_size = 44000  # Window size in samples
+    offset = 2200  # Overlap size in samples
+    processes = os.cpu_count()  # Number of files analyzed at the same time
+
+    num_files = len(find_wav_files(source))
+    failed = 0
+    # Files already analyzed with the same parameters are skipped, so an interrupted run can be restarted
+    for file_path, error in process_files(source, output_dir, window_size, offset, processes=processes):
+        if error is None:
+            print(f'done: {file_path}')
+        else:
+            failed += 1
+            print(f'failed: {file_path} ({error})')
+
+    print(f'{num_files} files, {failed} failed')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+import sys
+
+sys.path.append('..')
+
+from common.live import start_live_analysis
+
+
+def main():
+    # Raw int16 PCM or WAV from a named pipe given as argument, otherwise from stdin, e.g.
+    #   python pcm_generator.py 10 | python E1_live.py
+    #   mkfifo feed; python E1_live.py feed & python pcm_generator.py 10 > feed
+    stream = open(sys.argv[1], 'rb') if len(sys.argv) > 1 else sys.stdin.buffer
+
+    # Parameters for windowing and Fourier transform
+    window_size = 44100  # Window size in samples
+    offset = 4410  # Overlap size in samples, one result per hop
+    sample_rate = 44100  # Sampling rate of raw PCM, WAV streams carry their own
+
+    # Drop the oldest samples if printing falls behind, so the latency stays bounded
+    analyzer, reader = start_live_analysis(stream, window_size, offset, sample_rate, policy='drop')
+
+    for result in analyzer.run(reader):
+        print(f"{result['start'] / analyzer.sample_rate:8.2f}s  latency {result['latency'] * 1000:6.1f}ms  "
+              f"top {result['top_frequencies'][:3].tolist()}  dropped {reader.dropped}")
+
+    print(analyzer.counter.most_common(10))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,77 +1,138 @@
-import wave
+import os
+import sys
 import numpy as np
 import matplotlib.pyplot as plt
 import tracemalloc
 
+sys.path.append('..')
+
+from common.cache import ResultCache, cache_key
+from common.wav_io import audio_channels, audio_length, read_wav_params
+from common.parallel import map_batches, spectra_batch
+from common.planner import AnalysisPlan, plan_analysis
+from common.sliding_dft import sliding_spectra
+from common.spectral import window_starts
+from common.stats import RunningStats, batch_statistics
+
+
+def calculate_windowed_fft(audio_data, sample_rate, window_size, offset, processes=1, cache=None,
+                           dtype=np.float64, multichannel=False, plan=None):
+    """Calculate windowed Fourier transforms for the given audio data.
+
+    With a ResultCache the spectrogram is stored and only computed again if the audio or the parameters change.
+    dtype=np.float32 computes and returns single precision spectra (see windowed_spectra for the accuracy).
+    With multichannel all channels are transformed together and the result is (channels, windows, bins). A plan
+    (see plan_analysis) for the same parameters pads the windows to a fast FFT size and can decimate the audio
+    first, the result then has plan.num_bins bins at plan.frequencies().
+    """
+    if plan is None:
+        plan = AnalysisPlan(sample_rate, window_size, offset)
+    plan.check(sample_rate, window_size, offset)
+
+    if cache is not None:
+        key = cache_key(audio_data, 'spectrogram', window_size=window_size, offset=offset, window='hamming',
+                        channel='all' if multichannel else 0, dtype=np.dtype(dtype).name, **plan.parameters())
+        entry = cache.get_or_compute(key, lambda: {'fft_results': calculate_windowed_fft(
+            audio_data, sample_rate, window_size, offset, processes, dtype=dtype, multichannel=multichannel,
+            plan=plan)})
+        return entry['fft_results']
+
+    audio_data = plan.prepare(audio_data, dtype, multichannel)
+
+    # Array to store all windowed FFT results (non-negative half of the spectrum)
+    num_windows = len(window_starts(audio_length(audio_data), plan.analysis_window, plan.analysis_offset))
+    shape = (num_windows, plan.num_bins)
+    if multichannel:
+        shape = (audio_channels(audio_data),) + shape
+    fft_results = np.empty(shape, dtype=dtype)
+
+    # Perform sliding window Fourier transform, several windows per FFT call and optionally on several processes
+    index = 0
+    for starts, spectra in map_batches(audio_data, plan.analysis_window, plan.analysis_offset, spectra_batch,
+                                       processes, dtype=dtype, multichannel=multichannel, fft_size=plan.fft_size):
+        fft_results[..., index:index + len(starts), :] = spectra
+        index += len(starts)
+
+    return fft_results
 
-def load_wav_file(file_path):
-    """Load a WAV file and return the audio data and sampling rate."""
-    with wave.open(file_path, 'rb') as wav_file:
-        # Get the audio parameters
-        params = wav_file.getparams()
-        num_channels, sample_width, frame_rate, num_frames = params[:4]
 
-        # Read audio data
-        audio_data = np.frombuffer(wav_file.readframes(num_frames), dtype=np.int16)
+def calculate_statistics(fft_results):
+    """Calculate mean and standard deviation for each frequency across all windows."""
+    # Calculate mean and standard deviation for each frequency bin
+    mean_spectrum = np.mean(fft_results, axis=0)
+    std_spectrum = np.std(fft_results, axis=0)
 
-        # If the audio has more than one channel, take only the first one
-        if num_channels > 1:
-            audio_data = audio_data[::num_channels]
+    return mean_spectrum, std_spectrum
 
-        # Normalize audio data to range [-1, 1]
-        audio_data = audio_data / (2 ** 15)
 
-        return audio_data, frame_rate
+def calculate_streaming_statistics(audio_data, sample_rate, window_size, offset, processes=1, cache=None,
+                                   dtype=np.float64, multichannel=False, plan=None):
+    """Calculate mean and standard deviation for each frequency without keeping all windows in memory.
 
+    With a ResultCache the spectra are only computed again if the audio or the parameters change. With
+    dtype=np.float32 the spectra are single precision, the statistics are still accumulated in float64. With
+    multichannel the statistics of all channels are computed in one pass, as (channels, bins) arrays. A plan
+    (see plan_analysis) for the same parameters sets FFT size and decimation.
+    """
+    if plan is None:
+        plan = AnalysisPlan(sample_rate, window_size, offset)
+    plan.check(sample_rate, window_size, offset)
 
-def calculate_windowed_fft(audio_data, sample_rate, window_size, offset):
-    """Calculate windowed Fourier transforms for the given audio data."""
-    # Create a Hamming window of the specified size
-    window = np.hamming(window_size)
+    if cache is not None:
+        key = cache_key(audio_data, 'mean_std', window_size=window_size, offset=offset, window='hamming',
+                        channel='all' if multichannel else 0, dtype=np.dtype(dtype).name, **plan.parameters())
+        entry = cache.get_or_compute(key, lambda: dict(zip(('mean', 'std'), calculate_streaming_statistics(
+            audio_data, sample_rate, window_size, offset, processes, dtype=dtype, multichannel=multichannel,
+            plan=plan))))
+        return entry['mean'], entry['std']
 
-    # List to store all windowed FFT results
-    fft_results = []
+    audio_data = plan.prepare(audio_data, dtype, multichannel)
+    stats = RunningStats()
 
-    # Perform sliding window Fourier transform
-    start = 0
-    while start + window_size <= len(audio_data):
-        end = start + window_size
-        # Apply window to the audio data segment
-        segment = audio_data[start:end] * window
+    # Merge the statistics of every batch in order, so the result does not depend on the number of processes
+    for batch_stats in map_batches(audio_data, plan.analysis_window, plan.analysis_offset, batch_statistics,
+                                   processes, dtype=dtype, multichannel=multichannel, fft_size=plan.fft_size):
+        stats.merge(batch_stats)
 
-        # Compute the Fourier transform (magnitude spectrum)
-        spectrum = np.abs(np.fft.fft(segment))
+    return stats.mean, stats.std()
 
-        # Append the spectrum to the results list
-        fft_results.append(spectrum)
 
-        # Slide the window
-        start = start + offset
+def calculate_tracked_statistics(audio_data, sample_rate, window_size, offset, frequencies):
+    """Calculate mean and standard deviation for selected frequencies with a sliding DFT.
 
-    return np.array(fft_results)
+    Only the bins closest to the given frequencies are updated from hop to hop, which is much cheaper than a full
+    FFT per window for small hops. The periodic Hamming window is used (see SlidingDFT).
+    """
+    bins = np.rint(np.asarray(frequencies) * window_size / sample_rate).astype(int)
+    stats = RunningStats()
 
+    for _, spectra in sliding_spectra(audio_data, window_size, offset, bins=bins):
+        stats.update(spectra)
 
-def calculate_statistics(fft_results):
-    """Calculate mean and standard deviation for each frequency across all windows."""
-    # Calculate mean and standard deviation for each frequency bin
-    mean_spectrum = np.mean(fft_results, axis=0)
-    std_spectrum = np.std(fft_results, axis=0)
+    return stats.mean, stats.std()
 
-    return mean_spectrum, std_spectrum
 
+def plot_mean_and_std_spectrum(mean_spectrum, std_spectrum, sample_rate, window_size, plan=None):
+    """Plot the mean spectrum and standard deviation spectrum.
+
+    For spectra computed with a plan, the frequencies of the bins follow its FFT size and decimation.
+    """
+    if plan is None:
+        # The offset does not change the frequencies
+        plan = AnalysisPlan(sample_rate, window_size, window_size)
 
-def plot_mean_and_std_spectrum(mean_spectrum, std_spectrum, sample_rate):
-    """Plot the mean spectrum and standard deviation spectrum."""
-    # Calculate frequencies for the FFT bins
-    freqs = np.fft.fftfreq(len(mean_spectrum), 1 / sample_rate)
+    # Calculate frequencies for the FFT bins of the non-negative half spectrum
+    freqs = plan.frequencies()
+    # Bins in the transition band of the decimation filter are attenuated and not shown
+    half = min(plan.fft_size // 2, int(np.searchsorted(freqs, plan.max_frequency, side='right')))
 
     plt.figure(figsize=(10, 6))
 
     # Plotting the standard deviation spectrum as error bars
-    plt.errorbar(freqs[:len(freqs) // 2], mean_spectrum[:len(freqs) // 2], yerr=std_spectrum[:len(freqs) // 2],
+    plt.errorbar(freqs[:half], mean_spectrum[:half], yerr=std_spectrum[:half],
                  fmt='o', markersize=1, capsize=3, label='Standard Deviation', color='red')
     # Plotting the mean spectrum
-    plt.plot(freqs[:len(freqs) // 2], mean_spectrum[:len(freqs) // 2], label='Mean Spectrum', color='blue')
+    plt.plot(freqs[:half], mean_spectrum[:half], label='Mean Spectrum', color='blue')
     plt.xscale('log')
 
     plt.title('Mean Spectrum and Standard Deviation')
@@ -86,21 +147,28 @@ def plot_mean_and_std_spectrum(mean_spectrum, std_spectrum, sample_rate):
 def main():
     file_path = '../Audios/nicht_zu_laut_abspielen.wav'  # Update with your actual file path
 
-    # Load the WAV file
-    audio_data, sample_rate = load_wav_file(file_path)
+    # Only read the parameters here, the audio data is read block by block during the analysis
+    sample_rate = read_wav_params(file_path).framerate
 
     # Parameters for windowing and Fourier transform
     window_size = 44000  # Window size in samples
     offset = 1000  # Overlap size in samples
+    processes = os.cpu_count()  # Number of processes sharing the windows
+    dtype = np.float64  # np.float32 halves the memory traffic, see windowed_spectra for the accuracy
+    max_frequency = None  # Highest frequency of interest in Hz, the audio is decimated before the FFT if set
+    cache = ResultCache()  # Results of earlier runs with the same audio and parameters
 
-    # Calculate windowed Fourier transforms
-    fft_results = calculate_windowed_fft(audio_data, sample_rate, window_size, offset)
+    # Decimation and a fast FFT size (zero-padded windows) only for a limited range of frequencies, otherwise the
+    # windows are transformed as they are
+    plan = plan_analysis(sample_rate, window_size, offset, max_frequency, pad=max_frequency is not None)
 
-    # Calculate mean and standard deviation for each frequency bin
-    mean_spectrum, std_spectrum = calculate_statistics(fft_results)
+    # Calculate mean and standard deviation for each frequency bin while the windows are transformed
+    mean_spectrum, std_spectrum = calculate_streaming_statistics(file_path, sample_rate, window_size, offset,
+                                                                processes=processes, cache=cache, dtype=dtype,
+                                                                plan=plan)
 
     # Plot the mean spectrum and standard deviation spectrum
-    plot_mean_and_std_spectrum(mean_spectrum, std_spectrum, sample_rate)
+    plot_mean_and_std_spectrum(mean_spectrum, std_spectrum, sample_rate, window_size, plan)
 
 
 if __name__ == "__main__":
@@ -1,99 +1,169 @@
-import wave
-from collections import Counter
+import os
+import sys
+from functools import partial
 
 import numpy as np
 
+sys.path.append('..')
+
+from common.cache import ResultCache, cache_key
+from common.wav_io import audio_channels, read_wav_params
+from common.peaks import FrequencyCounter, top_frequency_dtype, top_frequency_table
+from common.parallel import map_batches
+from common.planner import AnalysisPlan, plan_analysis
+
+
+def calculate_windowed_fft(audio_data, sample_rate, window_size, offset, processes=1, cache=None,
+                           dtype=np.float64, multichannel=False, plan=None):
+    """Calculate windowed Fourier transforms for the given audio data.
+
+    With a ResultCache the table of prominent frequencies is only computed again if the audio or the parameters
+    change. dtype=np.float32 computes the spectra in single precision. With multichannel all channels are
+    transformed together and every record holds the prominent frequencies of every channel. A plan (see
+    plan_analysis) for the same parameters sets FFT size and decimation, start and end frames are always frames
+    of the given audio.
+    """
+    if plan is None:
+        plan = AnalysisPlan(sample_rate, window_size, offset)
+    plan.check(sample_rate, window_size, offset)
+
+    if cache is not None:
+        key = cache_key(audio_data, 'top_frequency_table', sample_rate=sample_rate, window_size=window_size,
+                        offset=offset, window='hamming', channel='all' if multichannel else 0, k=10,
+                        dtype=np.dtype(dtype).name, **plan.parameters())
+        entry = cache.get_or_compute(key, lambda: {'fft_results': calculate_windowed_fft(
+            audio_data, sample_rate, window_size, offset, processes, dtype=dtype, multichannel=multichannel,
+            plan=plan)})
+        return entry['fft_results']
+
+    # Find the 10 most prominent frequencies of all windows in a batch
+    batch_function = _top_frequency_function(plan)
+
+    # Perform sliding window Fourier transform, several windows per FFT call and optionally on several processes.
+    # The result tables of all batches (start, end and prominent frequencies per window) are kept in order.
+    fft_results = list(map_batches(plan.prepare(audio_data, dtype, multichannel), plan.analysis_window,
+                                   plan.analysis_offset, batch_function, processes, dtype=dtype,
+                                   multichannel=multichannel, fft_size=plan.fft_size))
+
+    # One record per window with the fields start_frame, end_frame and prominent_frequencies
+    if not fft_results:
+        return np.empty(0, dtype=top_frequency_dtype(10, audio_channels(audio_data) if multichannel else None))
+    fft_results = np.concatenate(fft_results)
+
+    # Frames of decimated audio are converted back to frames of the given audio
+    fft_results['start_frame'] *= plan.decimation
+    fft_results['end_frame'] *= plan.decimation
 
-def load_wav_file(file_path):
-    """Load a WAV file and return the audio data and sampling rate."""
-    with wave.open(file_path, 'rb') as wav_file:
-        # Get the audio parameters
-        params = wav_file.getparams()
-        num_channels, sample_width, frame_rate, num_frames = params[:4]
+    return fft_results
 
-        # Read audio data
-        audio_data = np.frombuffer(wav_file.readframes(num_frames), dtype=np.int16)
 
-        # If the audio has more than one channel, take only the first one
-        if num_channels > 1:
-            audio_data = audio_data[::num_channels]
+def _top_frequency_function(plan):
+    """Return the batch function for the table of the 10 most prominent frequencies of the windows of a plan."""
+    return partial(top_frequency_table, sample_rate=plan.analysis_rate, window_size=plan.analysis_window, k=10,
+                   fft_size=plan.fft_size)
 
-        # Normalize audio data to range [-1, 1]
-        audio_data = audio_data / (2 ** 15)
 
-        return audio_data, frame_rate
+def find_top_frequencies(fft_results):
+    """Find the 10 most frequently occurring frequencies across all windows."""
+    # Count the frequency of each unique frequency over the prominent frequencies of all windows
+    frequency_counter = FrequencyCounter().update(fft_results["prominent_frequencies"])
 
+    # Find the 10 most common frequencies
+    most_common_frequencies = frequency_counter.most_common(10)
 
-def calculate_windowed_fft(audio_data, sample_rate, window_size, offset):
-    """Calculate windowed Fourier transforms for the given audio data."""
-    # Create a Hamming window of the specified size
-    window = np.hamming(window_size)
+    return most_common_frequencies
 
-    # List to store all windowed FFT results and additional information
-    fft_results = []
 
-    # Perform sliding window Fourier transform
-    start = 0
-    while start + window_size <= len(audio_data):
-        end = start + window_size
+def calculate_top_frequencies(audio_data, sample_rate, window_size, offset, counter=None, processes=1, cache=None,
+                              dtype=np.float64, multichannel=False, plan=None):
+    """Count the prominent frequencies while the windows are produced and return the 10 most common ones.
 
-        # Apply window to the audio data segment
-        segment = audio_data[start:end] * window
+    Only the counts are kept, the counter can be a FrequencyCounter (exact) or a SpaceSaving sketch (fixed size).
+    With a ResultCache the exact counts are only computed again if the audio or the parameters change.
+    dtype=np.float32 computes the spectra in single precision. With multichannel all channels are transformed
+    together and one list of the most common frequencies is returned per channel, counter is then one counter
+    per channel. A plan (see plan_analysis) for the same parameters sets FFT size and decimation.
+    """
+    if plan is None:
+        plan = AnalysisPlan(sample_rate, window_size, offset)
+    plan.check(sample_rate, window_size, offset)
 
-        # Compute the Fourier transform (magnitude spectrum)
-        spectrum = np.abs(np.fft.fft(segment))
+    if multichannel:
+        return _calculate_channel_top_frequencies(audio_data, sample_rate, window_size, offset, counter, processes,
+                                                  cache, dtype, plan)
 
-        # Only take the first half of the spectrum (real signals)
-        spectrum = spectrum[:window_size // 2]
+    if cache is not None and counter is None:
+        key = cache_key(audio_data, 'top_frequencies', sample_rate=sample_rate, window_size=window_size,
+                        offset=offset, window='hamming', channel=0, k=10, ties='first_seen',
+                        dtype=np.dtype(dtype).name, **plan.parameters())
+        entry = cache.get_or_compute(key, lambda: {'most_common': np.array(calculate_top_frequencies(
+            audio_data, sample_rate, window_size, offset, processes=processes, dtype=dtype, plan=plan),
+            dtype=np.int64).reshape(-1, 2)})
+        return [tuple(pair) for pair in entry['most_common'].tolist()]
 
-        # Find the 10 most prominent frequencies
-        freq_indices = np.argsort(spectrum)[-10:][::-1]  # Indices of the 10 largest magnitudes
-        prominent_freqs = freq_indices * sample_rate / window_size  # Convert indices to frequencies
-        prominent_freqs = [round(x) for x in prominent_freqs]
+    if counter is None:
+        counter = FrequencyCounter()
 
-        # Append the start, end, and prominent frequencies to the results list
-        fft_results.append({
-            "start_frame": start,
-            "end_frame": end,
-            "prominent_frequencies": prominent_freqs
-        })
+    # Count the 10 most prominent frequencies of all windows, batch by batch
+    for table in map_batches(plan.prepare(audio_data, dtype), plan.analysis_window, plan.analysis_offset,
+                             _top_frequency_function(plan), processes, dtype=dtype, fft_size=plan.fft_size):
+        counter.update(table["prominent_frequencies"])
 
-        # Slide the window
-        start = start + offset
+    return counter.most_common(10)
 
-    return fft_results
 
+def _calculate_channel_top_frequencies(audio_data, sample_rate, window_size, offset, counters, processes, cache,
+                                       dtype, plan):
+    """Count the prominent frequencies of all channels in one pass, with one counter per channel."""
+    num_channels = audio_channels(audio_data)
+    if cache is not None and counters is None:
+        key = cache_key(audio_data, 'top_frequencies', sample_rate=sample_rate, window_size=window_size,
+                        offset=offset, window='hamming', channel='all', k=10, ties='first_seen',
+                        dtype=np.dtype(dtype).name, **plan.parameters())
 
-def find_top_frequencies(fft_results):
-    """Find the 10 most frequently occurring frequencies across all windows."""
-    # Collect all prominent frequencies from each window
-    all_frequencies = []
-    for result in fft_results:
-        all_frequencies.extend(result["prominent_frequencies"])
+        def compute():
+            most_common = _calculate_channel_top_frequencies(audio_data, sample_rate, window_size, offset, None,
+                                                             processes, None, dtype, plan)
+            return {f'most_common_{channel}': np.array(pairs, dtype=np.int64).reshape(-1, 2)
+                    for channel, pairs in enumerate(most_common)}
 
-    # Count the frequency of each unique frequency
-    frequency_counter = Counter(all_frequencies)
+        entry = cache.get_or_compute(key, compute)
+        return [[tuple(pair) for pair in entry[f'most_common_{channel}'].tolist()] for channel in range(num_channels)]
 
-    # Find the 10 most common frequencies
-    most_common_frequencies = frequency_counter.most_common(10)
+    if counters is None:
+        counters = [FrequencyCounter() for _ in range(num_channels)]
 
-    return most_common_frequencies
+    for table in map_batches(plan.prepare(audio_data, dtype, multichannel=True), plan.analysis_window,
+                             plan.analysis_offset, _top_frequency_function(plan), processes, dtype=dtype,
+                             multichannel=True, fft_size=plan.fft_size):
+        # The prominent frequencies are (windows, channels, k), every channel is counted on its own
+        for counter, frequencies in zip(counters, np.moveaxis(table["prominent_frequencies"], 1, 0)):
+            counter.update(frequencies)
+
+    return [counter.most_common(10) for counter in counters]
 
 
 def main():
     file_path = '../Audios/nicht_zu_laut_abspielen.wav'  # Update with your actual file path
 
-    # Load the WAV file
-    audio_data, sample_rate = load_wav_file(file_path)
+    # Only read the parameters here, the audio data is read block by block during the analysis
+    sample_rate = read_wav_params(file_path).framerate
 
     # Parameters for windowing and Fourier transform
     window_size = 44000  # Window size in samples
     offset = 2200  # Overlap size in samples
-
-    # Calculate windowed Fourier transforms
-    fft_results = calculate_windowed_fft(audio_data, sample_rate, window_size, offset)
-
-    top_frequencies = find_top_frequencies(fft_results)
+    processes = os.cpu_count()  # Number of processes sharing the windows
+    dtype = np.float64  # np.float32 halves the memory traffic, see windowed_spectra for the accuracy
+    max_frequency = None  # Highest frequency of interest in Hz, the audio is decimated before the FFT if set
+    cache = ResultCache()  # Results of earlier runs with the same audio and parameters
+
+    # Decimation and a fast FFT size (zero-padded windows) only for a limited range of frequencies, otherwise the
+    # windows are transformed as they are
+    plan = plan_analysis(sample_rate, window_size, offset, max_frequency, pad=max_frequency is not None)
+
+    # Calculate windowed Fourier transforms and count the prominent frequencies
+    top_frequencies = calculate_top_frequencies(file_path, sample_rate, window_size, offset, processes=processes,
+                                                cache=cache, dtype=dtype, plan=plan)
 
     print(top_frequencies)
 
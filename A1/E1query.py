@@ -0,0 +1,44 @@
+import sys
+
+import matplotlib.pyplot as plt
+
+sys.path.append('..')
+
+from common.spectrogram_h5 import StoredSpectrogram
+
+
+def plot_band_energy(starts, energies, sample_rate, low, high):
+    """Plot the energy of a frequency band over time."""
+    plt.figure(figsize=(10, 6))
+    plt.plot(starts / sample_rate, energies, color='blue')
+
+    plt.title(f'Energy between {low} Hz and {high} Hz')
+    plt.xlabel('Time (s)')
+    plt.ylabel('Energy')
+    plt.grid(True)
+    plt.savefig('band_energy.png')
+    plt.show()
+
+
+def main():
+    input_file = 'fft_results.h5'  # Written by E1save.py
+
+    # Frequency band of interest in Hz
+    low = 400
+    high = 500
+
+    with StoredSpectrogram(input_file) as spectrogram:
+        # Mean and standard deviation of the band, computed from the stored spectra
+        mean_spectrum, std_spectrum = spectrogram.statistics(low=low, high=high)
+        print(f'mean: {mean_spectrum.mean()}, std: {std_spectrum.mean()}')
+
+        # The 10 most common prominent frequencies of the whole recording
+        print(spectrogram.top_frequencies())
+
+        # Energy of the band in every window
+        starts, energies = spectrogram.band_energy(low, high)
+        plot_band_energy(starts, energies, spectrogram.sample_rate, low, high)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+import sys
+from time import perf_counter, sleep
+
+import numpy as np
+
+
+def generate(stream, duration, sample_rate=44100, block_frames=441, realtime=True):
+    """Write a test signal (two tones and noise) as raw int16 PCM to a binary stream, in real time if requested."""
+    rng = np.random.default_rng(0)
+    started = perf_counter()
+    for first in range(0, int(duration * sample_rate), block_frames):
+        t = np.arange(first, first + block_frames) / sample_rate
+        signal = 0.3 * np.sin(2 * np.pi * 440 * t) + 0.2 * np.sin(2 * np.pi * 1250 * t)
+        signal += 0.05 * rng.standard_normal(block_frames)
+        stream.write((signal * (2 ** 15 - 1)).astype('<i2').tobytes())
+        stream.flush()
+
+        if realtime:
+            # Wait until the written samples would have been played
+            delay = (first + block_frames) / sample_rate - (perf_counter() - started)
+            if delay > 0:
+                sleep(delay)
+
+
+def main():
+    # Usage: python pcm_generator.py [seconds] | python E1_live.py
+    duration = float(sys.argv[1]) if len(sys.argv) > 1 else 10
+    try:
+        generate(sys.stdout.buffer, duration)
+    except BrokenPipeError:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,66 +1,37 @@
-import json
-import wave
+import sys
 from time import time
 
 import numpy as np
 import matplotlib.pyplot as plt
-import tracemalloc
 
+sys.path.append('..')
 
-def load_wav_file(file_path):
-    """Load a WAV file and return the audio data and sampling rate."""
-    with wave.open(file_path, 'rb') as wav_file:
-        # Get the audio parameters
-        params = wav_file.getparams()
-        num_channels, sample_width, frame_rate, num_frames = params[:4]
+from common.instrumentation import Profiler, platform_name
+from common.wav_io import audio_length, read_wav_params
+from common.spectral import window_starts, windowed_spectra
+from common.stats import RunningStats
+from common.trace_log import write_trace
 
-        # Read audio data
-        audio_data = np.frombuffer(wav_file.readframes(num_frames), dtype=np.int16)
 
-        # If the audio has more than one channel, take only the first one
-        if num_channels > 1:
-            audio_data = audio_data[::num_channels]
-
-        # Normalize audio data to range [-1, 1]
-        audio_data = audio_data / (2 ** 15)
-
-        return audio_data, frame_rate
-
-
-def calculate_windowed_fft(audio_data, malloc: list, sample_rate, window_size, offset):
+def calculate_windowed_fft(audio_data, profiler, sample_rate, window_size, offset):
     """Calculate windowed Fourier transforms for the given audio data."""
-    # Create a Hamming window of the specified size
-    window = np.hamming(window_size)
-
-    # List to store all windowed FFT results
-    fft_results = []
+    # Array to store all windowed FFT results (non-negative half of the spectrum)
+    num_windows = len(window_starts(audio_length(audio_data), window_size, offset))
+    fft_results = np.empty((num_windows, window_size // 2 + 1))
 
     start_time = time()
-    tracemalloc.start()
-    # Perform sliding window Fourier transform
-    start = 0
-    while start + window_size <= len(audio_data):
-        end = start + window_size
-        # Apply window to the audio data segment
-        segment = audio_data[start:end] * window
-
-        # Compute the Fourier transform (magnitude spectrum)
-        spectrum = np.abs(np.fft.fft(segment))
-
-        # Append the spectrum to the results list
-        fft_results.append(spectrum)
-
-        current, peak = tracemalloc.get_traced_memory()
-        malloc.append([start, current, peak])
-
-        # Slide the window
-        start = start + offset
-
-    tracemalloc.stop()
+    profiler.start()
+    # Perform sliding window Fourier transform, several windows per FFT call
+    index = 0
+    for starts, spectra in windowed_spectra(audio_data, window_size, offset, profiler=profiler):
+        fft_results[index:index + len(starts)] = spectra
+        index += len(starts)
+
+    profiler.stop()
     end_time = time()
     print(f'runtime: {end_time - start_time}')
 
-    return np.array(fft_results)
+    return fft_results
 
 
 def calculate_statistics(fft_results):
@@ -72,18 +43,36 @@ def calculate_statistics(fft_results):
     return mean_spectrum, std_spectrum
 
 
-def plot_mean_and_std_spectrum(mean_spectrum, std_spectrum, sample_rate):
+def calculate_streaming_statistics(audio_data, profiler, sample_rate, window_size, offset):
+    """Calculate mean and standard deviation for each frequency without keeping all windows in memory."""
+    stats = RunningStats()
+
+    start_time = time()
+    profiler.start()
+    # Update the running statistics batch by batch while the spectra are produced
+    for starts, spectra in windowed_spectra(audio_data, window_size, offset, profiler=profiler):
+        stats.update(spectra)
+
+    profiler.stop()
+    end_time = time()
+    print(f'runtime: {end_time - start_time}')
+
+    return stats.mean, stats.std()
+
+
+def plot_mean_and_std_spectrum(mean_spectrum, std_spectrum, sample_rate, window_size):
     """Plot the mean spectrum and standard deviation spectrum."""
-    # Calculate frequencies for the FFT bins
-    freqs = np.fft.fftfreq(len(mean_spectrum), 1 / sample_rate)
+    # Calculate frequencies for the FFT bins of the non-negative half spectrum
+    freqs = np.fft.rfftfreq(window_size, 1 / sample_rate)
+    half = window_size // 2
 
     plt.figure(figsize=(10, 6))
 
     # Plotting the standard deviation spectrum as error bars
-    plt.errorbar(freqs[:len(freqs) // 2], mean_spectrum[:len(freqs) // 2], yerr=std_spectrum[:len(freqs) // 2],
+    plt.errorbar(freqs[:half], mean_spectrum[:half], yerr=std_spectrum[:half],
                  fmt='o', markersize=1, capsize=3, label='Standard Deviation', color='red')
     # Plotting the mean spectrum
-    plt.plot(freqs[:len(freqs) // 2], mean_spectrum[:len(freqs) // 2], label='Mean Spectrum', color='blue')
+    plt.plot(freqs[:half], mean_spectrum[:half], label='Mean Spectrum', color='blue')
     plt.xscale('log')
 
     plt.title('Mean Spectrum and Standard Deviation')
@@ -98,26 +87,26 @@ def plot_mean_and_std_spectrum(mean_spectrum, std_spectrum, sample_rate):
 def main():
     file_path = '../Audios/nicht_zu_laut_abspielen.wav'  # Update with your actual file path
 
-    # Load the WAV file
-    audio_data, sample_rate = load_wav_file(file_path)
+    # Only read the parameters here, the audio data is read block by block during the analysis
+    sample_rate = read_wav_params(file_path).framerate
 
     # Parameters for windowing and Fourier transform
     window_size = 44100  # Window size in samples
     offset = 441  # Overlap size in samples
-    malloc = []
+    profiler = Profiler(every_windows=100)  # Memory snapshot every 100 windows
 
-    # Calculate windowed Fourier transforms
-    fft_results = calculate_windowed_fft(audio_data, malloc, sample_rate, window_size, offset)
-
-    # Calculate mean and standard deviation for each frequency bin
-    # mean_spectrum, std_spectrum = calculate_statistics(fft_results)
+    # Calculate mean and standard deviation for each frequency bin while the windows are transformed
+    mean_spectrum, std_spectrum = calculate_streaming_statistics(file_path, profiler, sample_rate, window_size, offset)
 
     # Plot the mean spectrum and standard deviation spectrum
-    # plot_mean_and_std_spectrum(mean_spectrum, std_spectrum, sample_rate)
+    # plot_mean_and_std_spectrum(mean_spectrum, std_spectrum, sample_rate, window_size)
+
+    # Columnar trace with platform, window and hop in the header, see common/trace_log.py
+    malloc_file = f'{platform_name()}_stream_{window_size}_{offset}.trace'
+    write_trace(malloc_file, profiler.samples, platform=platform_name(), window_size=window_size, offset=offset,
+                sample_rate=sample_rate)
 
-    malloc_file = f'windows_raw_{window_size}_{offset}.json'
-    with open(malloc_file, 'wt', buffering=8192) as f:
-        json.dump(malloc, f, indent=4)
+    profiler.print_report()
 
 
 if __name__ == "__main__":
@@ -1,88 +1,45 @@
-import json
-import wave
-from collections import Counter
+import sys
 from time import time
 
 import numpy as np
-import tracemalloc
 
+sys.path.append('..')
 
-def load_wav_file(file_path):
-    """Load a WAV file and return the audio data and sampling rate."""
-    with wave.open(file_path, 'rb') as wav_file:
-        # Get the audio parameters
-        params = wav_file.getparams()
-        num_channels, sample_width, frame_rate, num_frames = params[:4]
+from common.instrumentation import Profiler, platform_name
+from common.wav_io import read_wav_params
+from common.peaks import FrequencyCounter, top_frequency_dtype, top_frequency_table
+from common.trace_log import write_trace
+from common.spectral import windowed_spectra
 
-        # Read audio data
-        audio_data = np.frombuffer(wav_file.readframes(num_frames), dtype=np.int16)
 
-        # If the audio has more than one channel, take only the first one
-        if num_channels > 1:
-            audio_data = audio_data[::num_channels]
-
-        # Normalize audio data to range [-1, 1]
-        audio_data = audio_data / (2 ** 15)
-
-        return audio_data, frame_rate
-
-
-def calculate_windowed_fft(audio_data, malloc: list, sample_rate, window_size, offset):
+def calculate_windowed_fft(audio_data, profiler, sample_rate, window_size, offset):
     """Calculate windowed Fourier transforms for the given audio data."""
-    # Create a Hamming window of the specified size
-    window = np.hamming(window_size)
-
-    # List to store all windowed FFT results and additional information
+    # List to store the result tables of all batches (start, end and prominent frequencies per window)
     fft_results = []
 
     start_time = time()
-    tracemalloc.start()
-    # Perform sliding window Fourier transform
-    start = 0
-    while start + window_size <= len(audio_data):
-        end = start + window_size
-
-        # Apply window to the audio data segment
-        segment = audio_data[start:end] * window
-
-        # Compute the Fourier transform (magnitude spectrum)
-        spectrum = np.abs(np.fft.fft(segment))
-
-        # Only take the first half of the spectrum (real signals)
-        spectrum = spectrum[:window_size // 2]
-
-        # Find the 10 most prominent frequencies
-        freq_indices = np.argsort(spectrum)[-10:][::-1]  # Indices of the 10 largest magnitudes
-        prominent_freqs = freq_indices * sample_rate / window_size  # Convert indices to frequencies
-        prominent_freqs = [round(x) for x in prominent_freqs]
-
-        # Append the start, end, and prominent frequencies to the results list
-        fft_results.append({
-            "start_frame": start,
-            "end_frame": end,
-            "prominent_frequencies": prominent_freqs
-        })
-
-        current, peak = tracemalloc.get_traced_memory()
-        malloc.append([start, current, peak])
-        # Slide the window
-        start = start + offset
-
-    tracemalloc.stop()
+    profiler.start()
+    # Perform sliding window Fourier transform, several windows per FFT call
+    for starts, spectra in windowed_spectra(audio_data, window_size, offset, profiler=profiler):
+        # Find the 10 most prominent frequencies of all windows in the batch
+        fft_results.append(top_frequency_table(starts, spectra, sample_rate, window_size, k=10))
+
+    profiler.stop()
     end_time = time()
     print(f'runtime: {end_time - start_time}')
+
+    # One record per window with the fields start_frame, end_frame and prominent_frequencies
+    if not fft_results:
+        return np.empty(0, dtype=top_frequency_dtype(10))
+    fft_results = np.concatenate(fft_results)
+
     return fft_results
 
 
 def find_top_frequencies(fft_results):
     """Find the 10 most frequently occurring frequencies across all windows."""
-    # Collect all prominent frequencies from each window
-    all_frequencies = []
-    for result in fft_results:
-        all_frequencies.extend(result["prominent_frequencies"])
-
-    # Count the frequency of each unique frequency
-    frequency_counter = Counter(all_frequencies)
+    # Count the frequency of each unique frequency over the prominent frequencies of all windows
+    frequency_counter = FrequencyCounter().update(fft_results["prominent_frequencies"])
 
     # Find the 10 most common frequencies
     most_common_frequencies = frequency_counter.most_common(10)
@@ -90,25 +47,48 @@ def find_top_frequencies(fft_results):
     return most_common_frequencies
 
 
+def calculate_top_frequencies(audio_data, profiler, sample_rate, window_size, offset, counter=None):
+    """Count the prominent frequencies while the windows are produced and return the 10 most common ones.
+
+    Only the counts are kept, the counter can be a FrequencyCounter (exact) or a SpaceSaving sketch (fixed size).
+    """
+    if counter is None:
+        counter = FrequencyCounter()
+
+    start_time = time()
+    profiler.start()
+    for starts, spectra in windowed_spectra(audio_data, window_size, offset, profiler=profiler):
+        # Count the 10 most prominent frequencies of all windows in the batch
+        table = top_frequency_table(starts, spectra, sample_rate, window_size, k=10)
+        counter.update(table["prominent_frequencies"])
+
+    profiler.stop()
+    end_time = time()
+    print(f'runtime: {end_time - start_time}')
+
+    return counter.most_common(10)
+
+
 def main():
     file_path = '../Audios/nicht_zu_laut_abspielen.wav'  # Update with your actual file path
 
-    # Load the WAV file
-    audio_data, sample_rate = load_wav_file(file_path)
+    # Only read the parameters here, the audio data is read block by block during the analysis
+    sample_rate = read_wav_params(file_path).framerate
 
     # Parameters for windowing and Fourier transform
     window_size = 44100  # Window size in samples
     offset = 441   # Overlap size in samples
-    malloc = []
+    profiler = Profiler(every_windows=100)  # Memory snapshot every 100 windows
 
-    # Calculate windowed Fourier transforms
-    fft_results = calculate_windowed_fft(audio_data, malloc, sample_rate, window_size, offset)
+    # Calculate windowed Fourier transforms and count the prominent frequencies
+    top_frequencies = calculate_top_frequencies(file_path, profiler, sample_rate, window_size, offset)
 
-    top_frequencies = find_top_frequencies(fft_results)
+    # Columnar trace with platform, window and hop in the header, see common/trace_log.py
+    malloc_file = f'{platform_name()}_{window_size}_{offset}.trace'
+    write_trace(malloc_file, profiler.samples, platform=platform_name(), window_size=window_size, offset=offset,
+                sample_rate=sample_rate)
 
-    malloc_file = f'windows_{window_size}_{offset}.json'
-    with open(malloc_file, 'wt') as f:
-        json.dump(malloc, f, indent=4)
+    profiler.print_report()
 
     print(top_frequencies)
 
@@ -1,14 +1,18 @@
-import json
+import sys
+
 import matplotlib.pyplot as plt
 
+sys.path.append('..')
+
+from common.trace_log import load_log
+
 dir = 'logs/cumulated/'
-file_name = 'windows_44100_441.json'
+file_name = 'windows_44100_441.json'  # Trace-Dateien (.trace) werden ebenfalls gelesen
 
-with open(f'{dir}{file_name}', 'r') as file:
-    data = json.load(file)
+columns, metadata = load_log(f'{dir}{file_name}')
 
-start_indices = [entry[0] for entry in data]
-memory_usage = [entry[1] / (10 ** 6) for entry in data]
+start_indices = columns['start']
+memory_usage = columns['current'] / (10 ** 6)
 
 plt.figure(figsize=(10, 6))
 plt.plot(start_indices, memory_usage, linestyle='-')
@@ -16,5 +20,5 @@ plt.title('Speicherbedarf über die Startindizes')
 plt.xlabel('Start Sample')
 plt.ylabel('Speicherbedarf (Megabyte)')
 plt.grid(True)
-plt.savefig(f'{file_name[:-5]}.png')
+plt.savefig(f'{file_name.rsplit(".", 1)[0]}.png')
 plt.show()
@@ -1,6 +1,11 @@
-import json
-import matplotlib.pyplot as plt
 import os
+import sys
+
+import matplotlib.pyplot as plt
+
+sys.path.append('..')
+
+from common.trace_log import load_log
 
 directory = 'logs/'
 
@@ -8,22 +13,22 @@ directory = 'logs/'
 plt.figure(figsize=(10, 6))
 
 
-# Iterieren durch alle Dateien im Verzeichnis
-for filename in os.listdir(directory):
-    if filename.endswith('.json'):
-        json_file_path = os.path.join(directory, filename)
+# Iterieren durch alle Dateien im Verzeichnis, Trace-Dateien haben Vorrang vor gleichnamigen JSON-Logs
+filenames = sorted(os.listdir(directory))
+for filename in filenames:
+    base_name, extension = os.path.splitext(filename)
+    if extension == '.trace' or (extension == '.json' and f'{base_name}.trace' not in filenames):
+        log_file_path = os.path.join(directory, filename)
 
-        # JSON-Daten aus der Datei einlesen
-        with open(json_file_path, 'r') as file:
-            data = json.load(file)
+        # Spalten und Metadaten (Plattform, Fenstergröße, Versatz) einlesen
+        columns, metadata = load_log(log_file_path)
 
         # Start-Indizes und Speicherbedarf extrahieren
-        start_indices = [entry[0] for entry in data]
-        memory_usage = [entry[1] / (10 ** 6) for entry in data]
+        start_indices = columns['start']
+        memory_usage = columns['current'] / (10 ** 6)
 
-        # Datei-Basename ohne Verzeichnis und Dateiendung
-        base_name = os.path.basename(filename)
-        legend_name = base_name.split('_')[0]
+        # Plattform aus dem Header, bei JSON-Logs aus dem Dateinamen
+        legend_name = metadata['platform']
 
         # Plot für jede Datei hinzufügen
         plt.plot(start_indices, memory_usage, linestyle='-', label=legend_name)
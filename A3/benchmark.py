@@ -0,0 +1,163 @@
+import json
+import os
+import sys
+import tempfile
+from multiprocessing import Pool
+from time import perf_counter, process_time
+
+import numpy as np
+
+sys.path.append('..')
+
+from common.instrumentation import machine_fingerprint
+from common.peaks import FrequencyCounter, top_frequency_table
+from common.pipeline import pipelined_spectra
+from common.spectral import window_starts, windowed_spectra
+from common.spectrogram_h5 import SpectrogramWriter
+from common.stats import RunningStats
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# Version of the result file layout
+SCHEMA_VERSION = 1
+
+
+def synthetic_signal(duration, sample_rate=44100, seed=0):
+    """Generate a reproducible test signal (a few tones, a chirp and noise) normalized to range [-1, 1]."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(duration * sample_rate)) / sample_rate
+
+    signal = 0.3 * np.sin(2 * np.pi * 440 * t) + 0.2 * np.sin(2 * np.pi * 1250 * t)
+    signal += 0.1 * np.sin(2 * np.pi * (200 + 50 * t) * t)
+    signal += 0.05 * rng.standard_normal(len(t))
+
+    # Quantize like a 16 bit recording
+    return np.round(signal / np.max(np.abs(signal)) * (2 ** 15 - 1)) / (2 ** 15)
+
+
+def run_mean_std(audio_data, sample_rate, window_size, offset):
+    """Mean and standard deviation spectrum (A1/E1_mean_std.py)."""
+    stats = RunningStats()
+    for _, spectra in windowed_spectra(audio_data, window_size, offset):
+        stats.update(spectra)
+    return stats.mean, stats.std()
+
+
+def run_top_frequencies(audio_data, sample_rate, window_size, offset):
+    """Most common prominent frequencies (A1/E1_top_frequencies.py)."""
+    counter = FrequencyCounter()
+    for starts, spectra in windowed_spectra(audio_data, window_size, offset):
+        counter.update(top_frequency_table(starts, spectra, sample_rate, window_size)['prominent_frequencies'])
+    return counter.most_common(10)
+
+
+def run_hdf5_save(audio_data, sample_rate, window_size, offset):
+    """Spectrogram written to an HDF5 file, reading and FFT on threads (A1/E1save.py)."""
+    num_windows = len(window_starts(len(audio_data), window_size, offset))
+    with tempfile.TemporaryDirectory() as directory:
+        output_file = os.path.join(directory, 'fft_results.h5')
+        with SpectrogramWriter(output_file, num_windows, window_size, offset, sample_rate) as writer:
+            for _, spectra in pipelined_spectra(audio_data, window_size, offset):
+                writer.write(spectra)
+
+
+PIPELINES = {
+    'mean_std': run_mean_std,
+    'top_frequencies': run_top_frequencies,
+    'hdf5_save': run_hdf5_save,
+}
+
+
+def peak_rss():
+    """Return the peak resident set size of this process in bytes, None if it cannot be determined."""
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports kilobytes, macOS bytes
+        return peak if sys.platform == 'darwin' else peak * 1024
+    if psutil is not None:
+        info = psutil.Process().memory_info()
+        return getattr(info, 'peak_wset', info.rss)
+    return None
+
+
+def run_case(pipeline, window_size, offset, duration, sample_rate, repetitions, warmup):
+    """Run one configuration with warmup and repetitions and return its result record."""
+    audio_data = synthetic_signal(duration, sample_rate)
+    run = PIPELINES[pipeline]
+    rss_before = peak_rss()
+
+    for _ in range(warmup):
+        run(audio_data, sample_rate, window_size, offset)
+
+    wall_times, cpu_times = [], []
+    for _ in range(repetitions):
+        wall_start, cpu_start = perf_counter(), process_time()
+        run(audio_data, sample_rate, window_size, offset)
+        wall_times.append(perf_counter() - wall_start)
+        cpu_times.append(process_time() - cpu_start)
+
+    num_windows = len(window_starts(len(audio_data), window_size, offset))
+    return {
+        'pipeline': pipeline,
+        'window_size': window_size,
+        'offset': offset,
+        'duration': duration,
+        'sample_rate': sample_rate,
+        'num_windows': num_windows,
+        'warmup': warmup,
+        'repetitions': repetitions,
+        'wall_time': wall_times,
+        'cpu_time': cpu_times,
+        'wall_time_median': float(np.median(wall_times)),
+        'cpu_time_median': float(np.median(cpu_times)),
+        'windows_per_second': num_windows / float(np.median(wall_times)) if num_windows else 0.0,
+        'rss_before': rss_before,
+        'peak_rss': peak_rss(),
+    }
+
+
+def run_benchmarks(pipelines, window_sizes, offsets, durations, sample_rate=44100, repetitions=5, warmup=1):
+    """Run every pipeline over the grid of window sizes, offsets and durations.
+
+    Every configuration runs in a fresh process, so the peak RSS belongs to that configuration alone.
+    """
+    results = []
+    for pipeline in pipelines:
+        for window_size in window_sizes:
+            for offset in offsets:
+                for duration in durations:
+                    with Pool(1) as pool:
+                        result = pool.apply(run_case, (pipeline, window_size, offset, duration, sample_rate,
+                                                       repetitions, warmup))
+                    print(f"{pipeline} {window_size} {offset} {duration}s: "
+                          f"{result['wall_time_median']:.3f}s, {result['windows_per_second']:.1f} windows/s")
+                    results.append(result)
+
+    return {'schema': SCHEMA_VERSION, 'machine': machine_fingerprint(), 'results': results}
+
+
+def main():
+    # Parameter grid
+    pipelines = list(PIPELINES)
+    window_sizes = [4410, 44100]  # Window sizes in samples
+    offsets = [441, 4410]  # Offsets in samples
+    durations = [10, 60]  # Lengths of the synthetic signals in seconds
+
+    report = run_benchmarks(pipelines, window_sizes, offsets, durations, repetitions=5, warmup=1)
+
+    os.makedirs('benchmarks', exist_ok=True)
+    result_file = f"benchmarks/{report['machine']['platform']}.json"
+    with open(result_file, 'wt') as f:
+        json.dump(report, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+import argparse
+import sys
+
+sys.path.append('..')
+
+from common.regression import DEFAULT_THRESHOLDS, compare_benchmarks, compare_traces, load_run, trace_summary
+
+
+def print_findings(findings):
+    for finding in findings:
+        p_value = '-' if finding['p_value'] is None else f"{finding['p_value']:.3f}"
+        flag = 'REGRESSION' if finding['regression'] else 'ok'
+        print(f"  {finding['metric']:<20} {finding['baseline']:>14.6g} -> {finding['value']:>14.6g} "
+              f"({finding['change']:+.1%}, p={p_value}) {flag}")
+
+
+def compare(baseline_path, run_paths, thresholds):
+    """Compare every run with the baseline, print the results and return the number of regressions."""
+    baseline = load_run(baseline_path)
+    regressions = 0
+
+    for path in run_paths:
+        run = load_run(path)
+        if run[0] != baseline[0]:
+            print(f'{path}: cannot compare a {run[0]} with a {baseline[0]} baseline')
+            continue
+
+        print(f"{path} ({run[2].get('platform', '?')}) against {baseline_path}:")
+        if run[0] == 'trace':
+            summary = trace_summary(run[1], run[2])
+            print('  ' + ', '.join(f'{name}={value:.6g}' for name, value in summary.items()))
+            findings = compare_traces(baseline[1:], run[1:], thresholds)
+            print_findings(findings)
+        else:
+            findings = []
+            for (pipeline, window_size, offset, duration), result in compare_benchmarks(baseline[1], run[1],
+                                                                                          thresholds).items():
+                print(f' {pipeline} {window_size} {offset} {duration}s')
+                print_findings(result)
+                findings.extend(result)
+        regressions += sum(finding['regression'] for finding in findings)
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare memory traces or benchmark reports with a baseline.')
+    parser.add_argument('baseline', help='baseline trace (.trace, .json) or benchmark report')
+    parser.add_argument('runs', nargs='+', help='traces or benchmark reports to compare')
+    for name, value in DEFAULT_THRESHOLDS.items():
+        parser.add_argument(f'--{name}', type=float, default=value, help=f'default {value}')
+    args = parser.parse_args()
+
+    thresholds = {name: getattr(args, name) for name in DEFAULT_THRESHOLDS}
+    regressions = compare(args.baseline, args.runs, thresholds)
+    print(f'{regressions} regression(s)')
+
+    # Non-zero exit code, so the comparison can fail a build
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
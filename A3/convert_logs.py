@@ -0,0 +1,26 @@
+import os
+import sys
+
+sys.path.append('..')
+
+from common.trace_log import convert_json_log
+
+
+def convert_directory(directory):
+    """Convert every JSON memory log in a directory into a trace file next to it."""
+    for filename in sorted(os.listdir(directory)):
+        if filename.endswith('.json'):
+            trace_path = convert_json_log(os.path.join(directory, filename))
+            print(f'{filename} -> {os.path.basename(trace_path)}')
+
+
+def main():
+    # Directories with JSON logs written by the tracemalloc scripts
+    directories = sys.argv[1:] or ['logs/', '../A2/logs/raw/', '../A2/logs/cumulated/']
+
+    for directory in directories:
+        convert_directory(directory)
+
+
+if __name__ == "__main__":
+    main()
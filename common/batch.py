@@ -0,0 +1,159 @@
+import hashlib
+import json
+import os
+from multiprocessing import Pool, cpu_count
+
+import numpy as np
+
+from common.fft_backend import set_threads
+from common.peaks import FrequencyCounter, top_frequency_table
+from common.spectral import windowed_spectra
+from common.stats import RunningStats
+from common.wav_io import read_wav_params
+
+
+def find_wav_files(source):
+    """Return the WAV files of a directory (recursively) or of a manifest file with one path per line.
+
+    Relative paths in a manifest are relative to the manifest, empty lines and lines starting with # are skipped.
+    """
+    if os.path.isdir(source):
+        paths = []
+        for directory, _, filenames in os.walk(source):
+            paths.extend(os.path.join(directory, name) for name in filenames if name.lower().endswith('.wav'))
+        return sorted(paths)
+
+    base = os.path.dirname(os.path.abspath(source))
+    with open(source, 'r') as f:
+        lines = [line.strip() for line in f]
+    return [os.path.join(base, line) for line in lines if line and not line.startswith('#')]
+
+
+def analysis_parameters(file_path, window_size, offset, top_k=10):
+    """Return the parameters a result depends on, including size and modification time of the file."""
+    status = os.stat(file_path)
+    return {
+        'window_size': window_size,
+        'offset': offset,
+        'window': 'hamming',
+        'top_k': top_k,
+        'file_size': status.st_size,
+        'file_mtime_ns': status.st_mtime_ns,
+    }
+
+
+def result_path(output_dir, file_path):
+    """Return the result file of a WAV file, unique per absolute path."""
+    digest = hashlib.sha1(os.path.abspath(file_path).encode()).hexdigest()[:16]
+    name = os.path.splitext(os.path.basename(file_path))[0]
+    return os.path.join(output_dir, f'{name}_{digest}.npz')
+
+
+def load_result(output_dir, file_path):
+    """Return the stored result of a WAV file as a dictionary, None if there is none."""
+    path = result_path(output_dir, file_path)
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        result = {name: data[name] for name in data.files}
+    result['parameters'] = json.loads(str(result['parameters']))
+    return result
+
+
+def is_completed(output_dir, file_path, window_size, offset, top_k=10):
+    """Check if the result of a WAV file exists and was computed with the same parameters from the same file."""
+    path = result_path(output_dir, file_path)
+    if not os.path.exists(path):
+        return False
+    try:
+        # Only the parameters are read, not the spectra
+        with np.load(path) as data:
+            parameters = json.loads(str(data['parameters']))
+        return parameters == analysis_parameters(file_path, window_size, offset, top_k)
+    except (OSError, ValueError, KeyError):
+        # Unreadable results, and results of files that are gone, are computed again
+        return False
+
+
+def analyze_file(file_path, window_size, offset, top_k=10):
+    """Compute mean and standard deviation spectrum and the most common prominent frequencies in one pass."""
+    sample_rate = read_wav_params(file_path).framerate
+    stats = RunningStats()
+    counter = FrequencyCounter()
+
+    for starts, spectra in windowed_spectra(file_path, window_size, offset):
+        stats.update(spectra)
+        table = top_frequency_table(starts, spectra, sample_rate, window_size, top_k)
+        counter.update(table['prominent_frequencies'])
+
+    if stats.count == 0:
+        raise ValueError(f'{file_path} is shorter than one window')
+
+    return {
+        'sample_rate': sample_rate,
+        'num_windows': stats.count,
+        'mean_spectrum': stats.mean,
+        'std_spectrum': stats.std(),
+        'top_frequencies': np.array(counter.most_common(top_k), dtype=np.int64).reshape(-1, 2),
+    }
+
+
+def save_result(output_dir, file_path, result, parameters):
+    """Write the result of a WAV file.
+
+    The file is replaced atomically, so an interrupted run never leaves a partial result behind.
+    """
+    path = result_path(output_dir, file_path)
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as f:
+        np.savez(f, file_path=os.path.abspath(file_path), parameters=json.dumps(parameters), **result)
+    os.replace(temporary, path)
+
+
+def _init_worker():
+    # The processes already use all cores, so every transform runs on a single thread
+    set_threads(1)
+
+
+def _process_file(job):
+    """Analyze one file in a worker process and store its result. Errors are returned instead of raised."""
+    file_path, output_dir, window_size, offset, top_k = job
+    try:
+        parameters = analysis_parameters(file_path, window_size, offset, top_k)
+        save_result(output_dir, file_path, analyze_file(file_path, window_size, offset, top_k), parameters)
+    except Exception as e:
+        return file_path, f'{type(e).__name__}: {e}'
+    return file_path, None
+
+
+def process_files(source, output_dir, window_size, offset, top_k=10, processes=None):
+    """Analyze all WAV files of a directory or manifest on a process pool and store one result per file.
+
+    Files whose results were already computed with the same parameters are skipped, so an interrupted run can
+    simply be started again. The largest files are scheduled first, so no worker is left with a large file at
+    the end. Yields (file path, None) for every finished file and (file path, error message) for failed ones,
+    including files of the manifest that are missing or unreadable.
+    """
+    if processes is None:
+        processes = cpu_count()
+    os.makedirs(output_dir, exist_ok=True)
+
+    sizes = []
+    for path in find_wav_files(source):
+        if is_completed(output_dir, path, window_size, offset, top_k):
+            continue
+        try:
+            sizes.append((os.path.getsize(path), path))
+        except OSError as e:
+            # Missing or unreadable files are reported like every other failed file
+            yield path, f'{type(e).__name__}: {e}'
+    sizes.sort(key=lambda item: item[0], reverse=True)
+    jobs = [(path, output_dir, window_size, offset, top_k) for _, path in sizes]
+
+    if processes <= 1:
+        yield from map(_process_file, jobs)
+        return
+
+    with Pool(min(processes, max(len(jobs), 1)), initializer=_init_worker) as pool:
+        # One file per task in the scheduled order, results arrive as soon as a file is done
+        yield from pool.imap_unordered(_process_file, jobs, chunksize=1)
@@ -0,0 +1,134 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from common.wav_io import WavMemmap
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'audio_analysis')
+DEFAULT_MAX_BYTES = 2 ** 30
+HASH_BLOCK = 1 << 20
+
+# Digests of files, valid as long as size and modification time do not change
+_file_digests = {}
+
+
+def file_digest(file_path):
+    """Return the hash of the contents of a file, remembered per size and modification time."""
+    status = os.stat(file_path)
+    key = (os.path.abspath(file_path), status.st_size, status.st_mtime_ns)
+    digest = _file_digests.get(key)
+    if digest is None:
+        h = hashlib.blake2b(digest_size=20)
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(HASH_BLOCK), b''):
+                h.update(block)
+        digest = _file_digests[key] = h.hexdigest()
+    return digest
+
+
+def audio_digest(audio_data):
+    """Return a hash of the audio payload of a WAV path, a WavMemmap or an array of samples."""
+    if isinstance(audio_data, str):
+        return file_digest(audio_data)
+    if isinstance(audio_data, WavMemmap):
+        return file_digest(audio_data.file_path)
+
+    audio_data = np.ascontiguousarray(audio_data)
+    h = hashlib.blake2b(digest_size=20)
+    h.update(f'{audio_data.dtype.str}{audio_data.shape}'.encode())
+    h.update(audio_data.data)
+    return h.hexdigest()
+
+
+def cache_key(audio_data, kind, **parameters):
+    """Return the key of an analysis result: the audio payload, the kind of result and its parameters."""
+    description = json.dumps({'audio': audio_digest(audio_data), 'kind': kind, 'parameters': parameters},
+                             sort_keys=True)
+    return hashlib.sha256(description.encode()).hexdigest()
+
+
+class ResultCache:
+    """Content-addressed store of analysis results (dictionaries of arrays) on disk.
+
+    Every entry is an .npz file named after its key. Reading an entry updates its modification time, and the
+    least recently used entries are deleted once the cache is larger than max_bytes.
+    """
+
+    def __init__(self, directory=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory or os.environ.get('ANALYSIS_CACHE_DIR', DEFAULT_CACHE_DIR)
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f'{key}.npz')
+
+    def get(self, key):
+        """Return the arrays stored under key, None if there is no such entry."""
+        path = self._path(key)
+        try:
+            with np.load(path) as data:
+                entry = {name: data[name] for name in data.files}
+        except (OSError, ValueError):
+            return None
+        # Mark as recently used
+        os.utime(path)
+        return entry
+
+    def put(self, key, arrays):
+        """Store a dictionary of arrays under key. Entries larger than the whole cache are not stored."""
+        # An uncompressed .npz file is at least as large as its arrays, so these are rejected before writing
+        if sum(np.asarray(array).nbytes for array in arrays.values()) > self.max_bytes:
+            return
+        path = self._path(key)
+        temporary = f'{path}.{os.getpid()}.tmp'
+        with open(temporary, 'wb') as f:
+            np.savez(f, **arrays)
+        # The headers of the arrays can still make the file too large
+        if os.path.getsize(temporary) > self.max_bytes:
+            os.remove(temporary)
+            return
+        os.replace(temporary, path)
+        self.evict()
+
+    def get_or_compute(self, key, compute):
+        """Return the arrays stored under key, computing and storing them with compute() if necessary."""
+        entry = self.get(key)
+        if entry is None:
+            entry = compute()
+            self.put(key, entry)
+        return entry
+
+    def entries(self):
+        """Return (modification time, size, path) of all entries, least recently used first."""
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.npz'):
+                path = os.path.join(self.directory, name)
+                try:
+                    status = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((status.st_mtime_ns, status.st_size, path))
+        return sorted(entries)
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        """Delete the least recently used entries until the cache is at most max_bytes large."""
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self):
+        for _, _, path in self.entries():
+            os.remove(path)
@@ -0,0 +1,102 @@
+import numpy as np
+
+# Samples per block of the finest pyramid level, and factor between two levels
+BASE_BLOCK = 256
+LEVEL_FACTOR = 4
+
+# Number of samples reduced at once while the pyramid is built
+BUILD_CHUNK = BASE_BLOCK * 2 ** 14
+
+
+def bucket_edges(length, num_buckets):
+    """Return the edges of num_buckets nearly equal buckets over length values."""
+    num_buckets = max(1, min(num_buckets, length))
+    return np.linspace(0, length, num_buckets + 1).astype(np.int64)
+
+
+def min_max_envelope(samples, num_buckets, mins=None, maxs=None):
+    """Return the bucket starts, minima and maxima of samples reduced to num_buckets buckets.
+
+    With mins and maxs given, samples are ignored and the envelopes of finer blocks are reduced further.
+    """
+    if mins is None:
+        mins = maxs = samples
+    if len(mins) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=mins.dtype), np.empty(0, dtype=maxs.dtype)
+
+    edges = bucket_edges(len(mins), num_buckets)
+    return edges[:-1], np.minimum.reduceat(mins, edges[:-1]), np.maximum.reduceat(maxs, edges[:-1])
+
+
+def decimate_peaks(x, y, num_points, log=False):
+    """Reduce a curve to about num_points points, keeping the maximum of every bucket (spectrum peaks).
+
+    Every maximum is placed at the x of the value it comes from. With log, the buckets are equally wide on a
+    logarithmic x axis (x proportional to the index, like FFT frequencies), so low frequencies keep their bins.
+    """
+    if len(y) <= num_points:
+        return x, y
+
+    if log:
+        # The first value (0 Hz) on its own, then geometrically growing buckets, narrow ones merged into one bin
+        edges = np.unique(np.geomspace(1, len(y), max(1, num_points - 1)).astype(np.int64))
+        edges = np.concatenate(([0], edges[edges < len(y)]))
+    else:
+        edges = bucket_edges(len(y), num_points)[:-1]
+    peaks = np.maximum.reduceat(y, edges)
+
+    # Position of the first maximum of every bucket
+    buckets = np.repeat(np.arange(len(edges)), np.diff(edges, append=len(y)))
+    hits = np.flatnonzero(y == peaks[buckets])
+    first = hits[np.diff(buckets[hits], prepend=-1) != 0]
+    return x[first], peaks
+
+
+class EnvelopePyramid:
+    """Min/max envelopes of a signal at several resolutions, for drawing long sections quickly."""
+
+    def __init__(self, samples, base_block=BASE_BLOCK, factor=LEVEL_FACTOR):
+        self.samples = samples
+        self.blocks = []  # Samples per block of every level
+        self.levels = []  # (mins, maxs) of every level
+
+        # Finest level, built chunk by chunk so memory-mapped signals are never loaded completely
+        mins, maxs = [], []
+        chunk = base_block * max(1, BUILD_CHUNK // base_block)
+        for start in range(0, len(samples), chunk):
+            part = np.asarray(samples[start:start + chunk])
+            _, part_mins, part_maxs = min_max_envelope(part, -(-len(part) // base_block))
+            mins.append(part_mins)
+            maxs.append(part_maxs)
+        if not mins:
+            return
+
+        block = base_block
+        level = (np.concatenate(mins), np.concatenate(maxs))
+        while True:
+            self.blocks.append(block)
+            self.levels.append(level)
+            if len(level[0]) <= 1:
+                break
+            block *= factor
+            _, level_mins, level_maxs = min_max_envelope(None, -(-len(level[0]) // factor), *level)
+            level = (level_mins, level_maxs)
+
+    def envelope(self, start, end, num_points):
+        """Return the sample positions, minima and maxima of the section start:end in about num_points buckets."""
+        samples_per_point = (end - start) / max(1, num_points)
+
+        # Coarsest level that still has at least one block per point, the raw samples for short sections
+        level = None
+        for i, block in enumerate(self.blocks):
+            if block <= samples_per_point:
+                level = i
+        if level is None:
+            positions, mins, maxs = min_max_envelope(np.asarray(self.samples[start:end]), num_points)
+            return positions + start, mins, maxs
+
+        block = self.blocks[level]
+        first, last = start // block, -(-end // block)
+        level_mins, level_maxs = self.levels[level]
+        positions, mins, maxs = min_max_envelope(None, num_points, level_mins[first:last], level_maxs[first:last])
+        return np.maximum(start, (positions + first) * block), mins, maxs
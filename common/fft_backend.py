@@ -0,0 +1,103 @@
+import functools
+import os
+
+import numpy as np
+
+try:
+    import scipy.fft as scipy_fft
+except ImportError:
+    scipy_fft = None
+
+try:
+    import pyfftw
+    import pyfftw.interfaces.numpy_fft as pyfftw_fft
+except ImportError:
+    pyfftw = None
+
+# Number of threads used per transform, set to 1 in worker processes
+_threads = os.cpu_count() or 1
+
+
+def set_threads(threads):
+    """Set the number of threads the backends use per transform."""
+    global _threads
+    _threads = max(1, threads)
+
+
+@functools.lru_cache(maxsize=32)
+def _cached_window(size, dtype, kind):
+    window = getattr(np, kind)(size).astype(dtype)
+    window.flags.writeable = False
+    return window
+
+
+def get_window(size, dtype=np.float64, kind='hamming'):
+    """Return a cached read-only window (np.hamming, np.hanning, ...) of the given size and dtype."""
+    return _cached_window(size, np.dtype(dtype).str, kind)
+
+
+class NumpyBackend:
+    """FFTs with numpy.fft (always available)."""
+
+    name = 'numpy'
+
+    def rfft(self, x, n=None, axis=-1):
+        return np.fft.rfft(x, n=n, axis=axis)
+
+    def fft(self, x, axis=-1):
+        return np.fft.fft(x, axis=axis)
+
+
+class ScipyBackend:
+    """FFTs with scipy.fft, batches are split across threads (scipy caches the plans itself)."""
+
+    name = 'scipy'
+
+    def rfft(self, x, n=None, axis=-1):
+        return scipy_fft.rfft(x, n=n, axis=axis, workers=_threads)
+
+    def fft(self, x, axis=-1):
+        return scipy_fft.fft(x, axis=axis, workers=_threads)
+
+
+class PyfftwBackend:
+    """FFTs with pyFFTW, the FFTW plans are kept in the pyFFTW interface cache."""
+
+    name = 'pyfftw'
+
+    def __init__(self):
+        pyfftw.interfaces.cache.enable()
+        pyfftw.interfaces.cache.set_keepalive_time(60)
+
+    def rfft(self, x, n=None, axis=-1):
+        return pyfftw_fft.rfft(x, n=n, axis=axis, threads=_threads, planner_effort='FFTW_MEASURE')
+
+    def fft(self, x, axis=-1):
+        return pyfftw_fft.fft(x, axis=axis, threads=_threads, planner_effort='FFTW_MEASURE')
+
+
+def available_backends():
+    """Return the names of the installed backends, fastest first."""
+    names = []
+    if pyfftw is not None:
+        names.append('pyfftw')
+    if scipy_fft is not None:
+        names.append('scipy')
+    names.append('numpy')
+    return names
+
+
+@functools.lru_cache(maxsize=None)
+def _cached_backend(name):
+    if name not in available_backends():
+        raise ValueError(f'FFT backend {name} is not available, use one of {available_backends()}')
+
+    return {'numpy': NumpyBackend, 'scipy': ScipyBackend, 'pyfftw': PyfftwBackend}[name]()
+
+
+def get_backend(name=None):
+    """Return the backend with the given name, or the fastest installed one.
+
+    Without a name the environment variable FFT_BACKEND is used if it is set.
+    """
+    return _cached_backend(name or os.environ.get('FFT_BACKEND') or available_backends()[0])
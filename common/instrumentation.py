@@ -0,0 +1,204 @@
+import os
+import platform
+import threading
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from time import perf_counter
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+import numpy as np
+
+from common.fft_backend import get_backend
+
+_page_size = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def platform_name():
+    """Return a short platform name like the ones used in logs/ (mac, windows, raspberrypi, ...)."""
+    system = platform.system()
+    if system == 'Darwin':
+        return 'mac'
+    if system == 'Windows':
+        return 'windows'
+    try:
+        with open('/proc/device-tree/model') as f:
+            if 'Raspberry Pi' in f.read():
+                return 'raspberrypi'
+    except OSError:
+        pass
+    return system.lower()
+
+
+def machine_fingerprint():
+    """Return a description of the machine and software the benchmark ran on."""
+    return {
+        'platform': platform_name(),
+        'node': platform.node(),
+        'system': platform.system(),
+        'release': platform.release(),
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'fft_backend': get_backend().name,
+    }
+
+
+def current_rss():
+    """Return the resident set size of this process in bytes, None if it cannot be determined."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * _page_size
+    except OSError:
+        pass
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    return None
+
+
+class StageTimer:
+    """Accumulated time of one pipeline stage."""
+
+    def __init__(self):
+        self.count = 0
+        self.windows = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, elapsed, windows=0):
+        self.count += 1
+        self.windows += windows
+        self.total += elapsed
+        self.max = max(self.max, elapsed)
+
+
+class Profiler:
+    """Switchable memory and latency instrumentation for the windowed analyses.
+
+    Memory snapshots are taken at most every every_windows windows or every every_ms milliseconds, whichever
+    comes first, instead of after every window. Every snapshot is [start, traced current, traced peak, rss,
+    elapsed microseconds, windows processed so far]; the first three columns match the old tracemalloc logs.
+    Stage timers (read, window, fft, reduce, write) cost two perf_counter calls per batch. A stage opened inside
+    another one on the same thread, like the write of a consumer inside the reduce stage, counts only for the
+    inner stage, so the stage totals add up to the busy time.
+    """
+
+    def __init__(self, enabled=True, every_windows=100, every_ms=None, trace_python=True):
+        self.enabled = enabled
+        self.every_windows = every_windows
+        self.every_ms = every_ms
+        self.trace_python = trace_python and enabled
+        self.samples = []
+        self.stages = {}
+        self._windows_since = 0
+        self._windows_total = 0
+        self._started = perf_counter()
+        self._last_sample = 0.0
+        self._nested = threading.local()  # Per thread, time of the stages inside every open stage
+
+    def start(self):
+        """Start tracing Python allocations if requested."""
+        if self.trace_python:
+            tracemalloc.start()
+        self._started = self._last_sample = perf_counter()
+        return self
+
+    def stop(self):
+        """Stop tracing Python allocations."""
+        if self.trace_python and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def stage(self, name, windows=0):
+        """Return a context manager that adds the time spent inside it to the given stage.
+
+        windows is the number of windows handled inside, it is used for the throughput of the stage.
+        """
+        if not self.enabled:
+            return nullcontext()
+        return self._timed(name, windows)
+
+    @contextmanager
+    def _timed(self, name, windows=0):
+        open_stages = self._nested.__dict__.setdefault('stages', [])
+        open_stages.append(0.0)
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = perf_counter() - start
+            inner = open_stages.pop()
+            if open_stages:
+                open_stages[-1] += elapsed
+            self.add(name, elapsed - inner, windows)
+
+    def add(self, name, elapsed, windows=0):
+        """Add elapsed seconds spent on windows windows to the given stage."""
+        if not self.enabled:
+            return
+        timer = self.stages.get(name)
+        if timer is None:
+            timer = self.stages[name] = StageTimer()
+        timer.add(elapsed, windows)
+
+    def timed_iter(self, iterable, name):
+        """Yield the items of iterable, adding the time spent producing them to the given stage."""
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def windows(self, start, count=1):
+        """Register count processed windows, the first of them starting at start, and take a snapshot if due."""
+        if not self.enabled:
+            return
+        self._windows_since += count
+        self._windows_total += count
+        now = perf_counter()
+        due = self.every_windows is not None and self._windows_since >= self.every_windows
+        due = due or (self.every_ms is not None and (now - self._last_sample) * 1000 >= self.every_ms)
+        if due or not self.samples:
+            self.snapshot(start)
+            self._windows_since = 0
+            self._last_sample = now
+
+    def snapshot(self, start):
+        """Record the memory usage at the given start index."""
+        current, peak = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (0, 0)
+        elapsed = int((perf_counter() - self._started) * 1e6)
+        self.samples.append([start, current, peak, current_rss(), elapsed, self._windows_total])
+
+    def report(self):
+        """Return the stage timings as a dictionary of total, count, maximum seconds and windows."""
+        return {name: {'total': timer.total, 'count': timer.count, 'max': timer.max, 'windows': timer.windows}
+                for name, timer in self.stages.items()}
+
+    def bottleneck(self):
+        """Return the stage with the most busy time, waiting times (stages ending in _wait) do not count."""
+        busy = {name: timer.total for name, timer in self.stages.items() if not name.endswith('_wait')}
+        return max(busy, key=busy.get) if busy else None
+
+    def print_report(self):
+        for name, timer in self.stages.items():
+            line = f'{name}: {timer.total:.3f}s in {timer.count} batches (max {timer.max * 1000:.1f}ms)'
+            if timer.windows and timer.total:
+                line += f', {timer.windows / timer.total:.1f} windows/s'
+            print(line)
+
+
+# Disabled profiler used when no instrumentation is requested
+NULL_PROFILER = Profiler(enabled=False)
@@ -0,0 +1,202 @@
+import queue
+import threading
+from time import perf_counter
+
+import numpy as np
+
+from common.fft_backend import get_window
+from common.peaks import SpaceSaving, top_k_frequencies
+from common.spectral import magnitude_spectra
+from common.stats import RollingStats
+from common.wav_io import BATCH_SIZE, WavFormat, decode_frames, read_wav_header
+
+# Number of blocks the reader may be ahead of the analysis
+QUEUE_BLOCKS = 16
+
+
+class _Prefixed:
+    """Stream that returns bytes that were already read before the rest of the stream."""
+
+    def __init__(self, head, stream):
+        self.head = head
+        self.stream = stream
+
+    def read(self, size):
+        data, self.head = self.head[:size], self.head[size:]
+        return data + self.stream.read(size - len(data))
+
+
+def open_pcm_stream(stream, sample_rate=44100, num_channels=1):
+    """Detect the format of a stream of samples.
+
+    A stream that starts with a RIFF header is read as WAV (any format read_wav_header supports), anything else
+    as raw little-endian int16 PCM with the given sampling rate and channels. Returns the WavFormat and the bytes
+    already read from the stream that belong to the samples.
+    """
+    head = stream.read(4)
+    if head != b'RIFF':
+        return WavFormat(num_channels, sample_rate, 2, False), head
+
+    wav_format, _ = read_wav_header(_Prefixed(head, stream), 'stream')
+    return wav_format, b''
+
+
+class PcmReader(threading.Thread):
+    """Reads PCM from a stream on a thread and hands blocks of samples to the analysis through a queue.
+
+    Every block is (stream index of its first frame, arrival time, samples of the first channel). The queue
+    holds at most max_blocks blocks. When it is full and policy is 'block', reading stops until the analysis
+    catches up, so the writer of a pipe is slowed down. With policy 'drop' the oldest block is dropped instead,
+    which bounds the latency; dropped counts the frames that were lost.
+    """
+
+    def __init__(self, stream, block_frames, wav_format, prefix=b'', max_blocks=QUEUE_BLOCKS, policy='block'):
+        super().__init__(daemon=True)
+        if policy not in ('block', 'drop'):
+            raise ValueError(f'unknown policy {policy}')
+        self.stream = stream
+        self.block_frames = block_frames
+        self.format = wav_format
+        self.prefix = prefix
+        self.policy = policy
+        self.blocks = queue.Queue(max_blocks)
+        self.dropped = 0
+        self.error = None
+
+    def run(self):
+        frame_bytes = self.format.sample_width * self.format.num_channels
+        pending = self.prefix
+        position = 0
+        try:
+            while True:
+                data = self.stream.read(self.block_frames * frame_bytes - len(pending))
+                if not data:
+                    break
+                pending += data
+                # Pipes may deliver partial frames, the rest is kept for the next read
+                usable = len(pending) - len(pending) % frame_bytes
+                if usable < self.block_frames * frame_bytes:
+                    continue
+                samples = decode_frames(pending[:usable], self.format, channel=0)
+                pending = pending[usable:]
+                self._put((position, perf_counter(), samples))
+                position += len(samples)
+        except Exception as e:
+            self.error = e
+        finally:
+            # Remaining complete frames and the end of the stream
+            usable = len(pending) - len(pending) % frame_bytes
+            if usable:
+                samples = decode_frames(pending[:usable], self.format, channel=0)
+                self._put((position, perf_counter(), samples))
+            self.blocks.put(None)
+
+    def _put(self, block):
+        if self.policy == 'block':
+            self.blocks.put(block)
+            return
+        while True:
+            try:
+                self.blocks.put_nowait(block)
+                return
+            except queue.Full:
+                try:
+                    _, _, oldest = self.blocks.get_nowait()
+                    self.dropped += len(oldest)
+                except queue.Empty:
+                    pass
+
+    def __iter__(self):
+        while True:
+            block = self.blocks.get()
+            if block is None:
+                if self.error is not None:
+                    raise self.error
+                return
+            yield block
+
+
+class LiveAnalyzer:
+    """Windowed FFT of a stream of samples, evaluated as soon as the hop that completes a window arrives.
+
+    Keeps the rolling mean and standard deviation spectrum of the last history windows and a fixed size
+    Space-Saving sketch of the prominent frequencies, so memory does not grow with the length of the stream.
+    """
+
+    def __init__(self, sample_rate, window_size, offset, k=10, history=100, capacity=1000):
+        self.sample_rate = sample_rate
+        self.window_size = window_size
+        self.offset = offset
+        self.k = k
+        self.window = get_window(window_size)
+        self.stats = RollingStats(history)
+        self.counter = SpaceSaving(capacity)
+        self.buffer = np.empty(0)  # Samples that are still needed for upcoming windows
+        self.buffer_start = 0  # Stream index of buffer[0]
+        self.next_start = 0  # Stream index of the next window
+
+    def feed(self, position, samples):
+        """Add the samples starting at stream index position and yield the windows they complete.
+
+        Start indices and spectra are yielded in batches of at most BATCH_SIZE windows.
+        """
+        buffer_end = self.buffer_start + len(self.buffer)
+        if position > buffer_end:
+            # Samples were dropped, windows continue on the same grid after the gap
+            self.buffer = np.empty(0)
+            self.buffer_start = position
+            self.next_start = max(self.next_start, -(-position // self.offset) * self.offset)
+        self.buffer = np.concatenate((self.buffer, samples))
+
+        first = self.next_start - self.buffer_start
+        available = len(self.buffer) - first - self.window_size
+        if available >= 0:
+            num_windows = available // self.offset + 1
+            windows = np.lib.stride_tricks.sliding_window_view(self.buffer[first:], self.window_size)[::self.offset]
+            for index in range(0, num_windows, BATCH_SIZE):
+                batch = windows[index:min(index + BATCH_SIZE, num_windows)]
+                starts = self.next_start + np.arange(index, index + len(batch)) * self.offset
+                yield starts, magnitude_spectra(batch, self.window)
+            self.next_start += num_windows * self.offset
+
+        # Only keep the samples of windows that are not complete yet
+        cut = min(self.next_start - self.buffer_start, len(self.buffer))
+        self.buffer = self.buffer[cut:].copy()
+        self.buffer_start += cut
+
+    def run(self, blocks):
+        """Analyze (position, arrival time, samples) blocks and yield one result dictionary per window.
+
+        Every result has the start index of the window, the latency between the arrival of its last block and
+        the result, its k most prominent frequencies in Hz and its magnitude spectrum.
+        """
+        for position, arrival, samples in blocks:
+            for starts, spectra in self.feed(position, samples):
+                frequencies = top_k_frequencies(spectra[:, :self.window_size // 2], self.sample_rate,
+                                                self.window_size, self.k).astype(np.int32)
+                self.stats.update(spectra)
+                self.counter.update(frequencies)
+
+                latency = perf_counter() - arrival
+                for start, top, spectrum in zip(starts.tolist(), frequencies, spectra):
+                    yield {'start': start, 'latency': latency, 'top_frequencies': top, 'spectrum': spectrum}
+
+
+def start_live_analysis(stream, window_size, offset, sample_rate=44100, num_channels=1, k=10, history=100,
+                        max_blocks=None, policy='block'):
+    """Start reading raw int16 PCM or a WAV file from a binary stream (stdin, a named pipe) while it is written.
+
+    Returns the analyzer and the running reader, the results are produced by analyzer.run(reader). Samples are
+    read in blocks of one hop, so a window is evaluated as soon as its last hop arrived. Memory is bounded by
+    max_blocks blocks, one window and the history of the rolling statistics. The queue holds at least one window
+    plus one hop, otherwise dropping blocks could leave no complete window.
+    """
+    if max_blocks is None:
+        max_blocks = QUEUE_BLOCKS
+    max_blocks = max(max_blocks, -(-window_size // offset) + 1)
+
+    wav_format, prefix = open_pcm_stream(stream, sample_rate, num_channels)
+    analyzer = LiveAnalyzer(wav_format.sample_rate, window_size, offset, k, history)
+    reader = PcmReader(stream, offset, wav_format, prefix, max_blocks, policy)
+    reader.start()
+    return analyzer, reader
@@ -0,0 +1,123 @@
+from multiprocessing import Pool, cpu_count, shared_memory
+
+import numpy as np
+
+from common.fft_backend import get_window, set_threads
+from common.spectral import audio_samples, magnitude_spectra, sliding_windows, window_starts, windowed_spectra
+from common.wav_io import BATCH_SIZE, WavMemmap, WavReader, audio_length, mapping_error, read_samples, read_wav_layout
+
+# State of a worker process, set once by _init_worker
+_worker = {}
+
+
+def _share_audio(audio_data, dtype=np.float64, multichannel=False):
+    """Put the audio data into shared memory and return the shared memory block and a description for workers.
+
+    WavMemmaps and WAV paths of formats WavMemmap can map are not copied, the workers map the file themselves, so
+    memory stays bounded as in the serial path. Other WAV paths (8 and 24 bit) are decoded once into shared
+    memory, in the given precision, with multichannel as contiguous (channels, samples) array.
+    """
+    if isinstance(audio_data, WavMemmap):
+        return None, ('memmap', audio_data.file_path)
+
+    if isinstance(audio_data, str) and mapping_error(read_wav_layout(audio_data)[0]) is None:
+        return None, ('memmap', audio_data)
+
+    if isinstance(audio_data, str):
+        with WavReader(audio_data) as wav_file:
+            num_frames = wav_file.getnframes()
+            shape = (wav_file.getnchannels(), num_frames) if multichannel else (num_frames,)
+            itemsize = np.dtype(dtype).itemsize
+            shm = shared_memory.SharedMemory(create=True, size=max(int(np.prod(shape)), 1) * itemsize)
+            shared = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+            # Decode block by block directly into the shared buffer
+            position = 0
+            while position < num_frames:
+                samples = read_samples(wav_file, 1 << 20, dtype, multichannel)
+                if samples.shape[-1] == 0:
+                    break
+                shared[..., position:position + samples.shape[-1]] = samples
+                position += samples.shape[-1]
+        return shm, ('shared', shm.name, shape, np.dtype(dtype))
+
+    audio_data, _ = audio_samples(audio_data, multichannel)
+    shm = shared_memory.SharedMemory(create=True, size=max(audio_data.nbytes, 1))
+    np.ndarray(audio_data.shape, dtype=audio_data.dtype, buffer=shm.buf)[:] = audio_data
+    return shm, ('shared', shm.name, audio_data.shape, audio_data.dtype)
+
+
+def _init_worker(source, window_size, offset, batch_size, batch_function, dtype=np.float64, multichannel=False,
+                 fft_size=None):
+    """Attach a worker process to the shared audio data."""
+    # The processes already use all cores, so every transform runs on a single thread
+    set_threads(1)
+
+    if source[0] == 'memmap':
+        wav = WavMemmap(source[1])
+        audio_data, scale = audio_samples(wav, multichannel)
+        _worker['wav'] = wav
+    else:
+        _, name, shape, shared_dtype = source
+        shm = shared_memory.SharedMemory(name=name)
+        audio_data, scale = np.ndarray(shape, dtype=shared_dtype, buffer=shm.buf), 1.0
+        # Keep a reference, otherwise the buffer is released
+        _worker['shm'] = shm
+
+    # Same window and batch layout as the serial path, so every batch gives the same results
+    _worker['windows'] = sliding_windows(audio_data, window_size, offset)
+    _worker['starts'] = window_starts(audio_data.shape[-1], window_size, offset)
+    window = get_window(window_size, dtype)
+    _worker['window'] = window * window.dtype.type(scale) if scale != 1.0 else window
+    _worker['fft_size'] = fft_size
+    _worker['batch_size'] = batch_size
+    _worker['batch_function'] = batch_function
+
+
+def _run_batch(index):
+    """Transform one batch of windows in a worker and apply the batch function to the spectra."""
+    first = index * _worker['batch_size']
+    last = first + _worker['batch_size']
+    spectra = magnitude_spectra(_worker['windows'][..., first:last, :], _worker['window'], _worker['fft_size'])
+    return _worker['batch_function'](_worker['starts'][first:last], spectra)
+
+
+def spectra_batch(starts, spectra):
+    """Batch function that keeps the start indices and spectra as they are."""
+    return starts, spectra
+
+
+def map_batches(audio_data, window_size, offset, batch_function, processes=1, batch_size=BATCH_SIZE,
+                dtype=np.float64, multichannel=False, fft_size=None):
+    """Apply batch_function(starts, spectra) to every batch of windowed spectra and yield the results in order.
+
+    With more than one process the batches are split across a process pool that reads the audio data from
+    shared memory. batch_function has to be picklable (a module level function or a functools.partial of one).
+    dtype selects the precision of windows and spectra, multichannel transforms all channels in the same batch
+    and fft_size zero-pads the windows (see windowed_spectra).
+    """
+    if processes is None:
+        processes = cpu_count()
+
+    if processes <= 1:
+        for starts, spectra in windowed_spectra(audio_data, window_size, offset, batch_size, dtype=dtype,
+                                                multichannel=multichannel, fft_size=fft_size):
+            yield batch_function(starts, spectra)
+        return
+
+    num_batches = -(-len(window_starts(audio_length(audio_data), window_size, offset)) // batch_size)
+    if num_batches == 0:
+        return
+
+    shm, source = _share_audio(audio_data, dtype, multichannel)
+    try:
+        with Pool(processes, initializer=_init_worker,
+                  initargs=(source, window_size, offset, batch_size, batch_function, dtype, multichannel,
+                            fft_size)) as pool:
+            # imap keeps the order of the batches, so partial results are merged deterministically
+            chunksize = max(1, num_batches // (processes * 4))
+            yield from pool.imap(_run_batch, range(num_batches), chunksize=chunksize)
+    finally:
+        if shm is not None:
+            shm.close()
+            shm.unlink()
@@ -0,0 +1,155 @@
+import numpy as np
+
+
+def top_frequency_dtype(k, num_channels=None):
+    """Return the record type for the start, end and k most prominent frequencies of a window.
+
+    With num_channels, every record holds the k most prominent frequencies of every channel.
+    """
+    shape = (k,) if num_channels is None else (num_channels, k)
+    return np.dtype([('start_frame', np.int64), ('end_frame', np.int64), ('prominent_frequencies', np.int32, shape)])
+
+
+def top_k_bins(spectra, k):
+    """Return the indices of the k largest bins of every spectrum in a batch, largest first."""
+    k = min(k, spectra.shape[-1])
+
+    # Partial selection of the k largest bins, only these k are sorted afterwards
+    indices = np.argpartition(spectra, -k, axis=-1)[..., -k:]
+    order = np.argsort(np.take_along_axis(spectra, indices, axis=-1), axis=-1)[..., ::-1]
+
+    return np.take_along_axis(indices, order, axis=-1)
+
+
+def top_k_frequencies(spectra, sample_rate, fft_size, k):
+    """Return the k most prominent frequencies of every spectrum in a batch in whole Hz, largest first.
+
+    Bin i is at i * sample_rate / fft_size Hz. Bins narrower than 1 Hz round to the same frequency, only the
+    largest of them counts, so every frequency appears at most once per spectrum.
+    """
+    frequencies = np.rint(np.arange(spectra.shape[-1]) * sample_rate / fft_size).astype(np.int64)
+    if np.any(frequencies[1:] == frequencies[:-1]):
+        # Largest magnitude of every whole Hz, the frequencies of the bins are ascending
+        first = np.flatnonzero(np.diff(frequencies, prepend=-1))
+        spectra = np.maximum.reduceat(spectra, first, axis=-1)
+        frequencies = frequencies[first]
+
+    return frequencies[top_k_bins(spectra, k)]
+
+
+def top_frequency_table(starts, spectra, sample_rate, window_size, k=10, fft_size=None):
+    """Return a record array with start, end and the k most prominent frequencies of every window in a batch.
+
+    Spectra of several channels (channels, windows, bins) give the frequencies of all channels per window. For
+    windows zero-padded to fft_size, bin i is at i * sample_rate / fft_size Hz. The frequencies are rounded to
+    whole Hz and distinct within every window (see top_k_frequencies), also where the bins are narrower than 1 Hz.
+    """
+    if fft_size is None:
+        fft_size = window_size
+
+    # Only take the first half of the spectrum (real signals), the k most prominent frequencies of it
+    frequencies = top_k_frequencies(spectra[..., :fft_size // 2], sample_rate, fft_size, k)
+
+    k = frequencies.shape[-1]
+    num_channels = spectra.shape[0] if spectra.ndim == 3 else None
+    table = np.empty(len(starts), dtype=top_frequency_dtype(k, num_channels))
+    table['start_frame'] = starts
+    table['end_frame'] = starts + window_size
+
+    # Windows as first axis
+    table['prominent_frequencies'] = frequencies if num_channels is None else np.moveaxis(frequencies, 0, 1)
+
+    return table
+
+
+class FrequencyCounter:
+    """Running counts of prominent frequencies, stored in an array indexed by the frequency (like np.bincount).
+
+    Like Counter.most_common, equal counts are ordered by the first occurrence of the frequency, so the position
+    of every frequency's first occurrence among all counted ones is stored as well.
+    """
+
+    def __init__(self):
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.first_seen = np.zeros(0, dtype=np.int64)
+        self.total = 0
+
+    def update(self, frequencies):
+        """Count a batch of frequencies (any shape of non-negative integers, counted in C order)."""
+        frequencies = np.ravel(frequencies)
+        batch_counts = np.bincount(frequencies)
+        values, first = np.unique(frequencies, return_index=True)
+        first_seen = np.zeros(len(batch_counts), dtype=np.int64)
+        first_seen[values] = first + self.total
+        self._add(batch_counts, first_seen, len(frequencies))
+        return self
+
+    def merge(self, other):
+        """Add the counts of another counter to this one, as if its frequencies were counted after these."""
+        self._add(other.counts, other.first_seen + self.total, other.total)
+        return self
+
+    def _add(self, counts, first_seen, total):
+        if len(counts) > len(self.counts):
+            self.counts = np.pad(self.counts, (0, len(counts) - len(self.counts)))
+            self.first_seen = np.pad(self.first_seen, (0, len(counts) - len(self.first_seen)))
+        # Frequencies that were not seen before take the position of their first occurrence in counts
+        new = (self.counts[:len(counts)] == 0) & (counts > 0)
+        self.first_seen[:len(counts)][new] = first_seen[new]
+        self.counts[:len(counts)] += counts
+        self.total += total
+
+    def most_common(self, n=10):
+        """Return the n most common frequencies and their counts, like Counter.most_common."""
+        frequencies = np.flatnonzero(self.counts)
+        counts = self.counts[frequencies]
+
+        # Descending counts, equal counts in the order of their first occurrence
+        order = np.lexsort((self.first_seen[frequencies], -counts))[:n]
+        return list(zip(frequencies[order].tolist(), counts[order].tolist()))
+
+
+class SpaceSaving:
+    """Heavy hitter sketch (Space-Saving) that keeps at most capacity counters.
+
+    Every frequency that occurs more than total / capacity times is guaranteed to be tracked. Its count is
+    overestimated by at most the error stored with it.
+    """
+
+    def __init__(self, capacity=100):
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+
+    def update(self, frequencies):
+        """Count a batch of frequencies (any shape of integers)."""
+        # Aggregate the batch first, the sketch is then updated once per distinct frequency
+        values, counts = np.unique(np.ravel(frequencies), return_counts=True)
+        for value, count in zip(values.tolist(), counts.tolist()):
+            self._add(value, count)
+        return self
+
+    def merge(self, other):
+        """Add the counters of another sketch to this one."""
+        for value, count in other.counts.items():
+            self._add(value, count, other.errors[value])
+        return self
+
+    def _add(self, value, count, error=0):
+        if value in self.counts:
+            self.counts[value] += count
+            self.errors[value] += error
+        elif len(self.counts) < self.capacity:
+            self.counts[value] = count
+            self.errors[value] = error
+        else:
+            # Replace the smallest counter, its count becomes the error bound of the new value
+            smallest = min(self.counts, key=self.counts.get)
+            minimum = self.counts.pop(smallest)
+            del self.errors[smallest]
+            self.counts[value] = minimum + count
+            self.errors[value] = minimum + error
+
+    def most_common(self, n=10):
+        """Return the n frequencies with the largest estimated counts, like Counter.most_common."""
+        return sorted(self.counts.items(), key=lambda item: (-item[1], item[0]))[:n]
@@ -0,0 +1,171 @@
+import queue
+import threading
+from time import perf_counter
+
+import numpy as np
+
+from common.fft_backend import get_backend, get_window
+from common.instrumentation import NULL_PROFILER
+from common.spectral import audio_samples, window_batches
+from common.wav_io import BATCH_SIZE, WavMemmap, wav_window_batches
+
+# Number of batches that may be in flight between two stages
+QUEUE_DEPTH = 4
+# Seconds a blocked stage waits before it checks whether the pipeline was stopped
+POLL_INTERVAL = 0.1
+
+
+class _Stopped(Exception):
+    """Raised in a stage thread when the consumer stopped the pipeline early."""
+
+
+class BufferPool:
+    """Fixed set of preallocated arrays that circulate between the stages of a pipeline."""
+
+    def __init__(self, count, shape, stop, dtype=np.float64):
+        self.free = queue.Queue()
+        self.stop = stop
+        for _ in range(count):
+            self.free.put(np.empty(shape, dtype=dtype))
+
+    def acquire(self):
+        """Return a free array, waiting until one is released."""
+        return _get(self.free, self.stop)
+
+    def release(self, array):
+        self.free.put(array)
+
+
+def _get(q, stop):
+    while True:
+        try:
+            return q.get(timeout=POLL_INTERVAL)
+        except queue.Empty:
+            if stop.is_set():
+                raise _Stopped()
+
+
+def _put(q, item, stop):
+    while True:
+        try:
+            q.put(item, timeout=POLL_INTERVAL)
+            return
+        except queue.Full:
+            if stop.is_set():
+                raise _Stopped()
+
+
+class _Stage(threading.Thread):
+    """Thread that runs one stage and passes an exception on to the consumer as the last item."""
+
+    def __init__(self, target, output, stop):
+        super().__init__(daemon=True)
+        self.target = target
+        self.output = output
+        self.stop = stop
+
+    def run(self):
+        try:
+            self.target()
+            _put(self.output, None, self.stop)
+        except _Stopped:
+            pass
+        except BaseException as e:
+            try:
+                _put(self.output, e, self.stop)
+            except _Stopped:
+                pass
+
+
+def pipelined_spectra(audio_data, window_size, offset, batch_size=BATCH_SIZE, depth=QUEUE_DEPTH,
+                      profiler=NULL_PROFILER, dtype=np.float64):
+    """Yield the same start indices and magnitude spectra as windowed_spectra, with reading and FFT on threads.
+
+    The read stage fills batches of windows, the FFT stage transforms them and the consumer reduces or writes
+    them, all three at the same time. Bounded queues of depth batches connect the stages and the batch and
+    spectrum arrays are preallocated once and reused: the yielded spectra are only valid until the next batch is
+    requested. The profiler counts busy time and windows per stage (read, fft, reduce) and the time every stage
+    waits for its input (read_wait, fft_wait, reduce_wait), profiler.bottleneck() names the slowest stage. The
+    reduce stage is the time the consumer spends on a batch without the stages it times itself (like write).
+    """
+    stop = threading.Event()
+    # Every stage can hold one buffer while depth buffers are queued
+    batches = BufferPool(depth + 2, (batch_size, window_size), stop, dtype)
+    spectra_pool = BufferPool(depth + 2, (batch_size, window_size // 2 + 1), stop, dtype)
+    windowed = queue.Queue(depth)
+    transformed = queue.Queue(depth)
+
+    # The normalization of raw samples is folded into the window
+    window = get_window(window_size, dtype)
+    if isinstance(audio_data, WavMemmap):
+        window = window * window.dtype.type(audio_data.scale)
+
+    def read():
+        # Every batch is read into the buffer acquired just before, so waiting for it is timed separately
+        ready = []
+        if isinstance(audio_data, str):
+            source = wav_window_batches(audio_data, window_size, offset, batch_size, acquire=ready.pop, dtype=dtype)
+        else:
+            source = _copied_batches(audio_data, window_size, offset, batch_size, ready.pop)
+
+        while True:
+            with profiler.stage('read_wait'):
+                ready.append(batches.acquire())
+            start = perf_counter()
+            try:
+                starts, batch = next(source)
+            except StopIteration:
+                return
+            profiler.add('read', perf_counter() - start, len(starts))
+            _put(windowed, (starts, batch), stop)
+
+    def transform():
+        backend = get_backend()
+        while True:
+            with profiler.stage('fft_wait'):
+                item = _get(windowed, stop)
+            if item is None or isinstance(item, BaseException):
+                # End of the audio data or an error of the read stage
+                _put(transformed, item, stop)
+                return
+            starts, batch = item
+            with profiler.stage('fft', len(starts)):
+                np.multiply(batch, window, out=batch)
+                spectra = spectra_pool.acquire()[:len(starts)]
+                # The input is real, so the negative frequencies are only the mirrored positive ones
+                np.abs(backend.rfft(batch, axis=-1), out=spectra)
+            batches.release(batch.base)
+            _put(transformed, (starts, spectra), stop)
+
+    reader = _Stage(read, windowed, stop)
+    fft = _Stage(transform, transformed, stop)
+    reader.start()
+    fft.start()
+
+    try:
+        while True:
+            with profiler.stage('reduce_wait'):
+                item = transformed.get()
+            if item is None:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            starts, spectra = item
+            with profiler.stage('reduce', len(starts)):
+                yield starts, spectra
+            spectra_pool.release(spectra.base)
+            profiler.windows(int(starts[0]), len(starts))
+    finally:
+        stop.set()
+        reader.join()
+        fft.join()
+
+
+def _copied_batches(audio_data, window_size, offset, batch_size, acquire):
+    """Yield batches of windows of an array or a WavMemmap copied into the arrays returned by acquire()."""
+    samples, _ = audio_samples(audio_data)
+    for starts, windows in window_batches(samples, window_size, offset, batch_size):
+        batch = acquire()[:len(starts)]
+        # For a memory map, this is where the samples are read from disk
+        np.copyto(batch, windows, casting='unsafe')
+        yield starts, batch
@@ -0,0 +1,194 @@
+import math
+
+import numpy as np
+
+from common.spectral import audio_samples
+from common.wav_io import WavReader, read_samples
+
+# Share of the decimated Nyquist frequency that is free of aliasing, the rest is the transition of the filter
+DECIMATION_PASSBAND = 0.8
+# Filter taps per unit of the decimation factor and Kaiser window shape of the low-pass. Everything that aliases
+# into the passband is attenuated by at least 71 dB (measured for factors 2 to 17), the passband ripple is 0.003 dB.
+TAPS_PER_FACTOR = 24
+KAISER_BETA = 7.0
+# Odd prime factors of FFT lengths that every backend transforms efficiently
+FAST_ODD_PRIMES = (3, 5, 7, 11)
+# Samples read and filtered at a time when decimating a WAV file
+DECIMATION_BLOCK = 1 << 20
+
+
+def next_fast_length(n):
+    """Return the smallest length >= n whose only prime factors are 2, 3, 5, 7 and 11.
+
+    pocketfft (numpy, scipy) and FFTW have dedicated passes for these factors, other prime factors fall back to
+    a generic algorithm that is many times slower. Lengths with only these factors are returned unchanged. The
+    result does not depend on the installed backend, so a plan and its cached results stay the same on every
+    machine.
+    """
+    best = 1 << max(0, n - 1).bit_length()
+    odd_parts = [1]
+    for prime in FAST_ODD_PRIMES:
+        # Every product of the primes so far with a power of this prime that does not exceed best
+        extended = []
+        for part in odd_parts:
+            while part <= best:
+                extended.append(part)
+                part *= prime
+        odd_parts = extended
+    # Smallest power of two that brings every odd part to at least n
+    return min(part << max(0, -(-n // part) - 1).bit_length() for part in odd_parts)
+
+
+def decimation_factor(sample_rate, window_size, offset, max_frequency):
+    """Return the largest decimation factor that keeps max_frequency below the passband edge of the filter.
+
+    Factors that divide window size and offset are preferred, so the windows stay on the grid of the original
+    samples. Only if that loses more than half of the possible reduction, window and offset are rounded.
+    """
+    largest = int(sample_rate * DECIMATION_PASSBAND / (2 * max_frequency))
+    largest = max(1, min(largest, window_size))
+    common = math.gcd(window_size, offset)
+    exact = max(factor for factor in range(1, largest + 1) if common % factor == 0)
+    return exact if 2 * exact >= largest else largest
+
+
+def lowpass_filter(factor, dtype=np.float64):
+    """Return the symmetric FIR low-pass (Kaiser windowed sinc) that precedes decimation by factor.
+
+    A Hamming window would stop at about 53 dB, however long the filter is.
+    """
+    num_taps = TAPS_PER_FACTOR * factor + 1
+    n = np.arange(num_taps) - num_taps // 2
+    # Cutoff at the Nyquist frequency after decimation, unit gain at 0 Hz
+    taps = np.sinc(n / factor) * np.kaiser(num_taps, KAISER_BETA)
+    return (taps / taps.sum()).astype(dtype)
+
+
+class Decimator:
+    """Low-pass filters and decimates a stream of samples block by block.
+
+    The filter is only evaluated at the kept samples (polyphase), so it costs about TAPS_PER_FACTOR
+    multiplications per input sample. Output sample j is centered on input sample j * factor, the stream is
+    padded with zeros at both ends. Blocks can be 1d or (channels, samples).
+    """
+
+    def __init__(self, factor, dtype=np.float64):
+        self.factor = factor
+        self.taps = lowpass_filter(factor, dtype)
+        self.pending = np.zeros(len(self.taps) // 2, dtype=dtype)  # Samples still needed for the next outputs
+
+    def process(self, samples):
+        """Filter a block and return the decimated samples that are complete."""
+        if self.pending.ndim < np.ndim(samples):
+            self.pending = np.zeros(np.shape(samples)[:-1] + self.pending.shape, dtype=self.pending.dtype)
+        data = np.concatenate((self.pending, samples), axis=-1)
+
+        count = max(0, (data.shape[-1] - len(self.taps)) // self.factor + 1)
+        windows = np.lib.stride_tricks.sliding_window_view(data, len(self.taps), axis=-1)
+        # The filter is symmetric, so the correlation with the taps is the convolution
+        decimated = windows[..., :count * self.factor:self.factor, :] @ self.taps
+        self.pending = data[..., count * self.factor:]
+        return decimated
+
+    def flush(self):
+        """Return the last decimated samples, filtered with zeros after the end of the stream."""
+        return self.process(np.zeros(self.pending.shape[:-1] + (len(self.taps) // 2,), dtype=self.pending.dtype))
+
+
+def decimate(audio_data, factor, dtype=np.float64, multichannel=False):
+    """Return the low-pass filtered audio data with every factor-th sample.
+
+    audio_data is an array, a WavMemmap or the path of a WAV file, which is read and filtered block by block, so
+    only the decimated samples are kept in memory.
+    """
+    decimator = Decimator(factor, dtype)
+    blocks = []
+    if isinstance(audio_data, str):
+        with WavReader(audio_data) as wav_file:
+            while True:
+                samples = read_samples(wav_file, DECIMATION_BLOCK, dtype, multichannel)
+                if samples.shape[-1] == 0:
+                    break
+                blocks.append(decimator.process(samples))
+    else:
+        samples, scale = audio_samples(audio_data, multichannel)
+        for start in range(0, samples.shape[-1], DECIMATION_BLOCK):
+            blocks.append(decimator.process(np.multiply(samples[..., start:start + DECIMATION_BLOCK], scale,
+                                                        dtype=dtype)))
+    blocks.append(decimator.flush())
+    return np.concatenate(blocks, axis=-1)
+
+
+class AnalysisPlan:
+    """Window, hop and FFT length of a windowed analysis, optionally of decimated audio.
+
+    sample_rate, window_size and offset describe the audio as it is given. The analysis runs at analysis_rate on
+    every decimation-th sample of the low-pass filtered audio, with windows of analysis_window samples every
+    analysis_offset samples that are zero-padded to fft_size. Spectra have fft_size // 2 + 1 bins, frequencies()
+    gives their frequencies. Magnitudes are sums over the window, with decimation they are smaller by about the
+    decimation factor.
+    """
+
+    def __init__(self, sample_rate, window_size, offset, fft_size=None, decimation=1):
+        self.sample_rate = sample_rate
+        self.window_size = window_size
+        self.offset = offset
+        self.decimation = decimation
+        self.analysis_rate = sample_rate / decimation
+        self.analysis_window = max(1, round(window_size / decimation))
+        self.analysis_offset = max(1, round(offset / decimation))
+        self.fft_size = fft_size or self.analysis_window
+        if self.fft_size < self.analysis_window:
+            raise ValueError(f'FFT size {self.fft_size} is smaller than the window ({self.analysis_window})')
+
+    def __repr__(self):
+        return (f'AnalysisPlan(sample_rate={self.sample_rate}, window_size={self.window_size}, offset={self.offset}, '
+                f'fft_size={self.fft_size}, decimation={self.decimation})')
+
+    def check(self, sample_rate, window_size, offset):
+        """Raise a ValueError if the plan was made for other parameters."""
+        if (sample_rate, window_size, offset) != (self.sample_rate, self.window_size, self.offset):
+            raise ValueError(f'{self} does not match sample rate {sample_rate}, window size {window_size} '
+                             f'and offset {offset}')
+
+    @property
+    def max_frequency(self):
+        """Highest frequency that is free of aliasing."""
+        nyquist = self.analysis_rate / 2
+        return nyquist * DECIMATION_PASSBAND if self.decimation > 1 else nyquist
+
+    @property
+    def num_bins(self):
+        return self.fft_size // 2 + 1
+
+    def frequencies(self):
+        """Return the frequencies of the bins of the spectra in Hz."""
+        return np.fft.rfftfreq(self.fft_size, 1 / self.analysis_rate)
+
+    def parameters(self):
+        """Return the parameters that distinguish the results of this plan, for cache keys."""
+        return {'fft_size': self.fft_size, 'decimation': self.decimation}
+
+    def prepare(self, audio_data, dtype=np.float64, multichannel=False):
+        """Return the audio data to analyze: as given without decimation, otherwise the decimated samples."""
+        if self.decimation == 1:
+            return audio_data
+        return decimate(audio_data, self.decimation, dtype, multichannel)
+
+
+def plan_analysis(sample_rate, window_size, offset, max_frequency=None, pad=True):
+    """Plan a windowed analysis with a fast FFT length and, for a maximum frequency of interest, decimation.
+
+    With max_frequency the audio is decimated by the largest factor that keeps max_frequency alias-free, which
+    divides the FFT size by about this factor. With pad, windows whose length has a prime factor above 11 are
+    zero-padded to the next fast length (see next_fast_length), other lengths are transformed as they are. The
+    frequency resolution stays about sample_rate / window_size.
+    """
+    decimation = 1
+    if max_frequency is not None:
+        decimation = decimation_factor(sample_rate, window_size, offset, max_frequency)
+
+    plan = AnalysisPlan(sample_rate, window_size, offset, decimation=decimation)
+    if pad:
+        plan = AnalysisPlan(sample_rate, window_size, offset, next_fast_length(plan.analysis_window), decimation)
+    return plan
@@ -0,0 +1,230 @@
+import json
+import math
+
+import numpy as np
+
+from common.trace_log import MISSING, load_log
+
+# Relative changes that count as a regression, and the significance level for the tests
+DEFAULT_THRESHOLDS = {
+    'peak': 0.10,  # Peak memory grows by more than 10 %
+    'growth': 0.10,  # Memory growth over the run adds more than 10 % of the baseline peak
+    'throughput': 0.05,  # Windows per second drop by more than 5 %
+    'latency': 0.10,  # 95th percentile latency per window grows by more than 10 %
+    'alpha': 0.05,
+}
+PERMUTATION_ROUNDS = 10000
+
+
+def load_run(path):
+    """Load a memory trace (.trace or .json list) or a benchmark report (A3/benchmark.py).
+
+    Returns ('trace', columns, metadata) or ('benchmark', report, metadata).
+    """
+    if path.endswith('.json'):
+        with open(path, 'r') as f:
+            content = json.load(f)
+        if isinstance(content, dict):
+            return 'benchmark', content, content.get('machine', {})
+    columns, metadata = load_log(path)
+    return 'trace', columns, metadata
+
+
+def linear_fit(x, y):
+    """Return slope and standard error of the slope of a least squares line through (x, y)."""
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    if len(x) < 3 or np.ptp(x) == 0:
+        return 0.0, math.inf
+    dx = x - x.mean()
+    sxx = dx @ dx
+    slope = (dx @ (y - y.mean())) / sxx
+    residuals = y - y.mean() - slope * dx
+    return float(slope), math.sqrt((residuals @ residuals) / (len(x) - 2) / sxx)
+
+
+def total_windows(columns, metadata):
+    """Return the number of windows processed between the first and the last snapshot."""
+    if 'windows' in columns:
+        return float(np.ptp(np.asarray(columns['windows'], dtype=np.float64)))
+    return float(np.ptp(np.asarray(columns['start'], dtype=np.float64))) / metadata['offset']
+
+
+def window_latencies(columns, metadata):
+    """Return the seconds per window between consecutive snapshots, empty if the trace has no timing."""
+    if 'elapsed_us' not in columns:
+        return np.empty(0)
+    elapsed = np.diff(np.asarray(columns['elapsed_us'], dtype=np.float64)) / 1e6
+    if 'windows' in columns:
+        windows = np.diff(np.asarray(columns['windows'], dtype=np.float64))
+    elif metadata.get('offset'):
+        windows = np.diff(np.asarray(columns['start'], dtype=np.float64)) / metadata['offset']
+    else:
+        return np.empty(0)
+    valid = windows > 0
+    return elapsed[valid] / windows[valid]
+
+
+def trace_summary(columns, metadata):
+    """Summarize a memory trace: peak memory, memory growth per sample and, if timed, throughput and latency."""
+    start = np.asarray(columns['start'], dtype=np.float64)
+    current = np.asarray(columns['current'], dtype=np.float64)
+    peak = np.asarray(columns.get('peak', current), dtype=np.float64)
+    slope, slope_error = linear_fit(start, current)
+
+    summary = {
+        'snapshots': len(start),
+        'span': float(np.ptp(start)) if len(start) else 0.0,
+        'peak': float(peak.max()) if len(peak) else 0.0,
+        'growth_slope': slope,  # Bytes per sample of audio
+        'growth_slope_error': slope_error,
+    }
+    if 'rss' in columns:
+        rss = np.asarray(columns['rss'])
+        rss = rss[rss != MISSING]
+        if len(rss):
+            summary['peak_rss'] = float(rss.max())
+
+    latencies = window_latencies(columns, metadata)
+    if len(latencies):
+        elapsed = np.asarray(columns['elapsed_us'], dtype=np.float64)
+        windows = total_windows(columns, metadata)
+        summary['windows_per_second'] = float(windows / (np.ptp(elapsed) / 1e6)) if np.ptp(elapsed) else 0.0
+        summary['latency_p50'] = float(np.percentile(latencies, 50))
+        summary['latency_p95'] = float(np.percentile(latencies, 95))
+        summary['latency_p99'] = float(np.percentile(latencies, 99))
+    return summary
+
+
+def benchmark_key(result):
+    return result['pipeline'], result['window_size'], result['offset'], result['duration']
+
+
+def align_runs(runs, column='current'):
+    """Align traces by start sample on the start indices of the first run within the range all runs cover.
+
+    Returns the common start indices and one row of interpolated values per run.
+    """
+    first = max(float(np.min(columns['start'])) for columns in runs)
+    last = min(float(np.max(columns['start'])) for columns in runs)
+    grid = np.asarray(runs[0]['start'], dtype=np.float64)
+    grid = grid[(grid >= first) & (grid <= last)]
+    values = np.array([np.interp(grid, np.asarray(columns['start'], dtype=np.float64),
+                                 np.asarray(columns[column], dtype=np.float64)) for columns in runs])
+    return grid, values
+
+
+def permutation_p_value(baseline, values, rounds=PERMUTATION_ROUNDS, seed=0):
+    """One-sided p-value of a permutation test that values have a larger mean than baseline."""
+    baseline = np.asarray(baseline, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    if len(baseline) == 0 or len(values) == 0:
+        return 1.0
+    observed = values.mean() - baseline.mean()
+    pooled = np.concatenate((baseline, values))
+
+    # Every row is one random relabelling of the pooled measurements, a block of rows at a time
+    rng = np.random.default_rng(seed)
+    block = max(1, min(rounds, 2 ** 20 // len(pooled)))
+    exceeded = 0
+    for first in range(0, rounds, block):
+        permuted = rng.permuted(np.tile(pooled, (min(block, rounds - first), 1)), axis=1)
+        differences = permuted[:, len(baseline):].mean(axis=1) - permuted[:, :len(baseline)].mean(axis=1)
+        exceeded += np.count_nonzero(differences >= observed)
+    return float((exceeded + 1) / (rounds + 1))
+
+
+def slope_p_value(baseline_slope, baseline_error, slope, error):
+    """One-sided p-value of a z-test that slope is larger than baseline_slope."""
+    scale = math.hypot(baseline_error, error)
+    if not math.isfinite(scale):
+        return 1.0
+    if scale == 0:
+        return 0.0 if slope > baseline_slope else 1.0
+    return 0.5 * math.erfc((slope - baseline_slope) / scale / math.sqrt(2))
+
+
+def _finding(metric, baseline, value, change, threshold, p_value, alpha):
+    return {
+        'metric': metric,
+        'baseline': baseline,
+        'value': value,
+        'change': change,
+        'p_value': p_value,
+        'regression': change > threshold and (p_value is None or p_value < alpha),
+    }
+
+
+def _relative(baseline, value):
+    return (value - baseline) / baseline if baseline else (math.inf if value > baseline else 0.0)
+
+
+def compare_traces(baseline, run, thresholds=None):
+    """Compare a memory trace with a baseline trace. Both are (columns, metadata) pairs.
+
+    Returns one finding per metric. Memory growth and latency are tested for significance, the peak memory is
+    a single value per run and is only compared against its threshold.
+    """
+    thresholds = {**DEFAULT_THRESHOLDS, **(thresholds or {})}
+    alpha = thresholds['alpha']
+    base_summary, summary = trace_summary(*baseline), trace_summary(*run)
+    findings = []
+
+    findings.append(_finding('peak', base_summary['peak'], summary['peak'],
+                             _relative(base_summary['peak'], summary['peak']), thresholds['peak'], None, alpha))
+
+    # Growth: additional memory the steeper slope accumulates over the baseline run, relative to its peak
+    extra = (summary['growth_slope'] - base_summary['growth_slope']) * base_summary['span']
+    findings.append(_finding('growth_slope', base_summary['growth_slope'], summary['growth_slope'],
+                             extra / base_summary['peak'] if base_summary['peak'] else 0.0, thresholds['growth'],
+                             slope_p_value(base_summary['growth_slope'], base_summary['growth_slope_error'],
+                                           summary['growth_slope'], summary['growth_slope_error']), alpha))
+
+    # Memory at the same start samples
+    grid, values = align_runs([baseline[0], run[0]])
+    if len(grid):
+        difference = float(np.max(values[1] - values[0]))
+        findings.append(_finding('aligned_memory', 0.0, difference,
+                                 difference / base_summary['peak'] if base_summary['peak'] else 0.0,
+                                 thresholds['peak'], None, alpha))
+
+    if 'windows_per_second' in base_summary and 'windows_per_second' in summary:
+        base_latencies, latencies = window_latencies(*baseline), window_latencies(*run)
+        findings.append(_finding('windows_per_second', base_summary['windows_per_second'],
+                                 summary['windows_per_second'],
+                                 -_relative(base_summary['windows_per_second'], summary['windows_per_second']),
+                                 thresholds['throughput'], permutation_p_value(base_latencies, latencies), alpha))
+        findings.append(_finding('latency_p95', base_summary['latency_p95'], summary['latency_p95'],
+                                 _relative(base_summary['latency_p95'], summary['latency_p95']),
+                                 thresholds['latency'],
+                                 # Tested on the slower half of the windows of both runs
+                                 permutation_p_value(base_latencies[base_latencies >= base_summary['latency_p50']],
+                                                     latencies[latencies >= summary['latency_p50']]), alpha))
+    return findings
+
+
+def compare_benchmarks(baseline, report, thresholds=None):
+    """Compare a benchmark report with a baseline report, configuration by configuration.
+
+    Returns a dictionary of configuration (pipeline, window_size, offset, duration) to findings. The wall times
+    of the repetitions are tested for significance.
+    """
+    thresholds = {**DEFAULT_THRESHOLDS, **(thresholds or {})}
+    alpha = thresholds['alpha']
+    base_results = {benchmark_key(result): result for result in baseline['results']}
+    comparisons = {}
+
+    for result in report['results']:
+        base = base_results.get(benchmark_key(result))
+        if base is None:
+            continue
+        p_value = permutation_p_value(base['wall_time'], result['wall_time'])
+        findings = [_finding('windows_per_second', base['windows_per_second'], result['windows_per_second'],
+                             -_relative(base['windows_per_second'], result['windows_per_second']),
+                             thresholds['throughput'], p_value, alpha)]
+        if base.get('peak_rss') and result.get('peak_rss'):
+            findings.append(_finding('peak_rss', base['peak_rss'], result['peak_rss'],
+                                     _relative(base['peak_rss'], result['peak_rss']), thresholds['peak'], None,
+                                     alpha))
+        comparisons[benchmark_key(result)] = findings
+    return comparisons
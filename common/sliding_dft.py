@@ -0,0 +1,107 @@
+import numpy as np
+
+from common.fft_backend import get_backend, get_window
+from common.spectral import audio_samples, window_batches
+from common.wav_io import BATCH_SIZE, wav_window_batches
+
+# Number of windows after which the spectrum is recomputed with a full FFT to bound the numerical drift
+RESYNC_INTERVAL = 200
+
+# Upper limit for the precomputed twiddle factors (hop x tracked bins) in bytes
+MAX_TWIDDLE_BYTES = 64 * 2 ** 20
+
+
+class SlidingDFT:
+    """Sliding DFT that updates selected bins of a window from the samples entering and leaving it.
+
+    The Hamming window is applied in the frequency domain. This is exact for the periodic Hamming window
+    0.54 - 0.46 * cos(2 * pi * n / N), which differs slightly from the symmetric np.hamming(N).
+    """
+
+    def __init__(self, window_size, offset, bins=None, resync_interval=RESYNC_INTERVAL):
+        self.window_size = window_size
+        self.offset = offset
+        self.resync_interval = resync_interval
+        self.bins = np.arange(window_size // 2 + 1) if bins is None else np.asarray(bins)
+
+        # The Hamming window needs the neighbours of every bin, the DFT is periodic in the bin index
+        neighbours = np.concatenate((self.bins - 1, self.bins, self.bins + 1)) % window_size
+        self.tracked = np.unique(neighbours)
+        self.left, self.center, self.right = np.searchsorted(self.tracked, neighbours).reshape(3, -1)
+
+        # Moving the window by one hop rotates every bin by a constant phase
+        self.rotation = np.exp(2j * np.pi * self.tracked * offset / window_size)
+
+        # DFT of the difference between entering and leaving samples. Sliding only pays off if this direct DFT is
+        # cheaper than a transform of the whole window, otherwise every window is transformed (see sliding)
+        self.twiddles = None
+        direct_cost = offset * len(self.tracked)
+        fft_cost = window_size * max(1, int(np.log2(window_size)))
+        if offset < window_size and direct_cost < fft_cost and direct_cost * 16 <= MAX_TWIDDLE_BYTES:
+            self.twiddles = np.exp(-2j * np.pi * np.outer(np.arange(offset), self.tracked) / window_size)
+
+        self.dft = None
+        self.updates = 0
+
+    @property
+    def sliding(self):
+        """True if the bins are updated from hop to hop, False if every window gets a full transform."""
+        return self.twiddles is not None
+
+    def reset(self, window):
+        """Compute the tracked bins of a window with a full FFT."""
+        self.dft = get_backend().fft(window)[self.tracked]
+        self.updates = 0
+
+    def slide(self, leaving, entering):
+        """Move the window by one hop, given the first hop samples of the old and the last of the new window."""
+        self.dft += (entering - leaving) @ self.twiddles
+        self.dft *= self.rotation
+        self.updates += 1
+
+    def spectrum(self):
+        """Return the magnitudes of the selected bins of the Hamming windowed window."""
+        dft = self.dft
+        return np.abs(0.54 * dft[self.center] - 0.23 * (dft[self.left] + dft[self.right]))
+
+    def update(self, previous, window):
+        """Advance from the previous to the given window and return the magnitudes of the selected bins."""
+        if previous is None or not self.sliding or self.updates >= self.resync_interval:
+            self.reset(window)
+        else:
+            self.slide(previous[:self.offset], window[-self.offset:])
+        return self.spectrum()
+
+
+def sliding_spectra(audio_data, window_size, offset, bins=None, resync_interval=RESYNC_INTERVAL,
+                    batch_size=BATCH_SIZE):
+    """Yield the start indices and magnitude spectra of the selected bins in batches, like windowed_spectra.
+
+    audio_data is either an array of samples, a WavMemmap or the path of a WAV file. If sliding is not cheaper
+    than a full transform (many bins or large hops), the windows are transformed in batches like in
+    windowed_spectra, still with the periodic Hamming window.
+    """
+    scale = 1.0
+    if isinstance(audio_data, str):
+        batches = wav_window_batches(audio_data, window_size, offset, batch_size)
+    else:
+        samples, scale = audio_samples(audio_data)
+        batches = window_batches(samples, window_size, offset, batch_size)
+
+    sdft = SlidingDFT(window_size, offset, bins, resync_interval)
+    if not sdft.sliding:
+        # np.hamming(N + 1) without its last value is the periodic window of length N
+        window = get_window(window_size + 1)[:-1] * scale
+        backend = get_backend()
+        for starts, windows in batches:
+            yield starts, np.abs(backend.rfft(windows * window, axis=-1)[:, sdft.bins])
+        return
+
+    previous = None
+    for starts, windows in batches:
+        spectra = np.empty((len(starts), len(sdft.bins)))
+        for i, window in enumerate(windows):
+            window = window * scale
+            spectra[i] = sdft.update(previous, window)
+            previous = window
+        yield starts, spectra
@@ -0,0 +1,120 @@
+import numpy as np
+
+from common.fft_backend import get_backend, get_window
+from common.instrumentation import NULL_PROFILER
+from common.wav_io import BATCH_SIZE, WavMemmap, wav_window_batches
+
+# Largest deviations of dtype=np.float32 results from the float64 path, relative to the largest value (of every
+# window for spectra, over all bins for statistics). The largest measured values are in brackets, for
+# Audios/nicht_zu_laut_abspielen.wav (44.1 kHz, 16 bit, first channel) with windows of 1024 to 88000 samples and
+# hops of 1/10 to 1/40 of the window, scipy backend. The std error grows with the window size (8.9e-6 at
+# 44100/4410), the bounds leave a margin of at least 4x. The sets of top-k frequencies only differ where two
+# bins are equal within the spectrum error.
+FLOAT32_ERROR_BOUNDS = {
+    'spectrum': 1e-6,  # (2.2e-7)
+    'mean': 1e-6,  # (7.7e-8)
+    'std': 5e-5,  # (8.9e-6)
+}
+
+
+def window_starts(num_samples, window_size, offset):
+    """Return the start indices of all complete windows."""
+    if num_samples < window_size:
+        return np.arange(0)
+    return np.arange(0, num_samples - window_size + 1, offset)
+
+
+def sliding_windows(audio_data, window_size, offset):
+    """Return a strided view of all complete windows along the last axis, nothing is copied."""
+    return np.lib.stride_tricks.sliding_window_view(audio_data, window_size, axis=-1)[..., ::offset, :]
+
+
+def window_batches(audio_data, window_size, offset, batch_size=BATCH_SIZE):
+    """Yield the start indices and strided views of consecutive batches of windows.
+
+    For (channels, samples) arrays every batch holds the same windows of all channels: (channels, batch, window).
+    """
+    starts = window_starts(audio_data.shape[-1], window_size, offset)
+    if len(starts) == 0:
+        return
+
+    windows = sliding_windows(audio_data, window_size, offset)
+
+    for i in range(0, len(starts), batch_size):
+        yield starts[i:i + batch_size], windows[..., i:i + batch_size, :]
+
+
+def audio_samples(audio_data, multichannel=False):
+    """Return the samples of an array or a WavMemmap and the scale that normalizes them to range [-1, 1].
+
+    Without multichannel only the first channel is returned, with multichannel a (channels, samples) array.
+    """
+    if isinstance(audio_data, WavMemmap):
+        return (audio_data.channels() if multichannel else audio_data.channel(0)), audio_data.scale
+
+    audio_data = np.asarray(audio_data)
+    if multichannel:
+        return np.atleast_2d(audio_data), 1.0
+    return (audio_data[0] if audio_data.ndim == 2 else audio_data), 1.0
+
+
+def magnitude_spectra(windows, window, fft_size=None):
+    """Return the magnitude of the non-negative half spectrum for every window along the last axis.
+
+    The windows are weighted in the precision of window, so a float32 window gives float32 spectra. With
+    fft_size, the windows are zero-padded to that length before the transform.
+    """
+    # The input is real, so the negative frequencies are only the mirrored positive ones
+    return np.abs(get_backend().rfft(np.multiply(windows, window, dtype=window.dtype), n=fft_size, axis=-1))
+
+
+def batch_spectra(batches, window_size, scale=1.0, profiler=NULL_PROFILER, dtype=np.float64, fft_size=None):
+    """Yield the start indices and magnitude spectra for batches of Hamming windowed segments.
+
+    The profiler times the read, window and fft stages. Everything the consumer does with a batch until it asks
+    for the next one is counted as reduce stage, except for stages it times itself. After that the windows are
+    registered for memory snapshots.
+    Windowing and FFT are computed in dtype (float64 or float32), windows are zero-padded to fft_size.
+    """
+    # The normalization of raw samples is folded into the window
+    window = get_window(window_size, dtype)
+    if scale != 1.0:
+        window = window * window.dtype.type(scale)
+
+    for starts, windows in profiler.timed_iter(batches, 'read'):
+        with profiler.stage('window'):
+            windows = np.multiply(windows, window, dtype=window.dtype)
+        with profiler.stage('fft'):
+            # The input is real, so the negative frequencies are only the mirrored positive ones
+            spectra = np.abs(get_backend().rfft(windows, n=fft_size, axis=-1))
+
+        with profiler.stage('reduce'):
+            yield starts, spectra
+        profiler.windows(int(starts[0]), len(starts))
+
+
+def windowed_spectra(audio_data, window_size, offset, batch_size=BATCH_SIZE, profiler=NULL_PROFILER,
+                     dtype=np.float64, multichannel=False, fft_size=None):
+    """Yield the start indices and magnitude spectra of Hamming windowed segments in batches.
+
+    audio_data is either an array of samples, a WavMemmap (normalized per window) or the path of a WAV file,
+    which is then read block by block. Only the first channel is analyzed, unless multichannel is set: all
+    channels are then transformed in the same call and the spectra have the shape (channels, batch, bins).
+    Arrays with several channels are (channels, samples).
+
+    With dtype=np.float32 samples, windows and spectra are single precision, which halves memory traffic. Samples
+    of up to 24 bit are exact in float32, the FFT adds rounding errors relative to the largest magnitude of every
+    window (see FLOAT32_ERROR_BOUNDS). Bins more than about 120 dB below the peak of their window lose their
+    relative accuracy.
+
+    With fft_size larger than window_size, every window is zero-padded to that length (see plan_analysis), the
+    spectra then have fft_size // 2 + 1 bins.
+    """
+    if isinstance(audio_data, str):
+        batches = wav_window_batches(audio_data, window_size, offset, batch_size, dtype=dtype,
+                                     multichannel=multichannel)
+        return batch_spectra(batches, window_size, profiler=profiler, dtype=dtype, fft_size=fft_size)
+
+    samples, scale = audio_samples(audio_data, multichannel)
+    batches = window_batches(samples, window_size, offset, batch_size)
+    return batch_spectra(batches, window_size, scale=scale, profiler=profiler, dtype=dtype, fft_size=fft_size)
@@ -0,0 +1,182 @@
+import h5py
+import numpy as np
+
+from common.peaks import FrequencyCounter, top_k_frequencies
+from common.stats import RunningStats
+
+# Size of one HDF5 chunk in bytes, chunks span several windows and a band of frequencies
+CHUNK_BYTES = 2 ** 20
+
+
+def chunk_shape(num_windows, num_bins, itemsize=4):
+    """Return a chunk shape that suits reads of time ranges as well as reads of frequency bands."""
+    # Split the bins into equally wide bands of at most 4096 bins
+    bands = -(-num_bins // 4096)
+    bins = max(1, -(-num_bins // bands))
+    windows = max(1, min(num_windows, CHUNK_BYTES // (bins * itemsize)))
+    return windows, bins
+
+
+class SpectrogramWriter:
+    """Write the magnitude spectra of all windows into a preallocated, chunked HDF5 dataset.
+
+    Only the non-negative half of each spectrum is stored. Rows are collected until a whole chunk row is
+    complete, so every chunk is written once.
+    """
+
+    def __init__(self, output_file, num_windows, window_size, offset, sample_rate=None, compression=None,
+                 dataset='fft_results', dtype=np.float32):
+        num_bins = window_size // 2 + 1
+        chunks = chunk_shape(num_windows, num_bins, np.dtype(dtype).itemsize)
+
+        # Chunk cache large enough for one row of chunks
+        row_bytes = chunks[0] * num_bins * np.dtype(dtype).itemsize
+        self.file = h5py.File(output_file, 'w', rdcc_nbytes=max(CHUNK_BYTES, row_bytes) * 2)
+        self.dset = self.file.create_dataset(dataset, (num_windows, num_bins), dtype=dtype,
+                                             chunks=chunks if num_windows > 0 else None,
+                                             compression=compression, shuffle=compression is not None)
+
+        # Parameters of the analysis, window i starts at sample i * offset
+        self.dset.attrs['window_size'] = window_size
+        self.dset.attrs['offset'] = offset
+        self.dset.attrs['window'] = 'hamming'
+        self.dset.attrs['spectrum'] = 'magnitude, non-negative frequencies'
+        if sample_rate is not None:
+            self.dset.attrs['sample_rate'] = sample_rate
+
+        self.buffer = np.empty((chunks[0], num_bins), dtype=dtype)
+        self.buffered = 0
+        self.index = 0
+
+    def write(self, spectra):
+        """Append a batch of spectra (one row per window)."""
+        while len(spectra) > 0:
+            count = min(len(spectra), len(self.buffer) - self.buffered)
+            self.buffer[self.buffered:self.buffered + count] = spectra[:count]
+            self.buffered += count
+            spectra = spectra[count:]
+
+            if self.buffered == len(self.buffer):
+                self.flush()
+
+    def flush(self):
+        """Write the collected rows into the dataset."""
+        if self.buffered == 0:
+            return
+        if self.index + self.buffered > len(self.dset):
+            raise ValueError('more spectra were written than windows were allocated')
+
+        self.dset[self.index:self.index + self.buffered] = self.buffer[:self.buffered]
+        self.index += self.buffered
+        self.buffered = 0
+
+    def close(self):
+        """Write the remaining rows and close the file."""
+        self.flush()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class StoredSpectrogram:
+    """Out-of-core access to a spectrogram written by SpectrogramWriter.
+
+    All reductions stream the dataset in blocks of whole chunk rows and only read the chunks of the requested
+    time range and frequency band.
+    """
+
+    def __init__(self, file_path, dataset='fft_results'):
+        self.file = h5py.File(file_path, 'r')
+        self.dset = self.file[dataset]
+        self.window_size = int(self.dset.attrs['window_size'])
+        self.offset = int(self.dset.attrs['offset'])
+        self.sample_rate = int(self.dset.attrs.get('sample_rate', 44100))
+
+    def __len__(self):
+        return len(self.dset)
+
+    def frequencies(self):
+        """Return the frequencies of the stored bins."""
+        return np.fft.rfftfreq(self.window_size, 1 / self.sample_rate)[:self.dset.shape[1]]
+
+    def window_range(self, start_sample=None, end_sample=None):
+        """Return the range of windows that lie completely between start_sample and end_sample."""
+        first = 0 if start_sample is None else -(-start_sample // self.offset)
+        if end_sample is None:
+            last = len(self)
+        else:
+            last = max(first, (end_sample - self.window_size) // self.offset + 1)
+        return min(first, len(self)), min(last, len(self))
+
+    def bin_range(self, low=None, high=None):
+        """Return the range of bins with frequencies between low and high (Hz)."""
+        freqs = self.frequencies()
+        first = 0 if low is None else int(np.searchsorted(freqs, low, side='left'))
+        last = len(freqs) if high is None else int(np.searchsorted(freqs, high, side='right'))
+        return first, max(first, last)
+
+    def iter_blocks(self, start_sample=None, end_sample=None, low=None, high=None):
+        """Yield the start samples and spectra of the requested region, one block of chunk rows at a time."""
+        first, last = self.window_range(start_sample, end_sample)
+        low_bin, high_bin = self.bin_range(low, high)
+        row_bytes = self.dset.shape[1] * self.dset.dtype.itemsize
+        rows = self.dset.chunks[0] if self.dset.chunks else max(1, CHUNK_BYTES // row_bytes)
+
+        # Blocks are aligned to the chunk rows, so no chunk is read twice
+        block_start = first
+        while block_start < last:
+            block_end = min(last, (block_start // rows + 1) * rows)
+            spectra = self.dset[block_start:block_end, low_bin:high_bin].astype(np.float64)
+            yield np.arange(block_start, block_end) * self.offset, spectra
+            block_start = block_end
+
+    def query(self, start_sample=None, end_sample=None, low=None, high=None):
+        """Return start samples, frequencies and spectra of a time range and frequency band."""
+        low_bin, high_bin = self.bin_range(low, high)
+        blocks = list(self.iter_blocks(start_sample, end_sample, low, high))
+        if not blocks:
+            return np.empty(0, dtype=np.int64), self.frequencies()[low_bin:high_bin], np.empty((0, high_bin - low_bin))
+
+        starts, spectra = zip(*blocks)
+        return np.concatenate(starts), self.frequencies()[low_bin:high_bin], np.concatenate(spectra)
+
+    def statistics(self, start_sample=None, end_sample=None, low=None, high=None):
+        """Return the mean and standard deviation of every bin in the requested region."""
+        stats = RunningStats()
+        for _, spectra in self.iter_blocks(start_sample, end_sample, low, high):
+            stats.update(spectra)
+        return stats.mean, stats.std()
+
+    def band_energy(self, low=None, high=None, start_sample=None, end_sample=None):
+        """Return the start samples and the energy (sum of squared magnitudes) of a frequency band per window."""
+        starts, energies = [np.empty(0, dtype=np.int64)], [np.empty(0)]
+        for block_starts, spectra in self.iter_blocks(start_sample, end_sample, low, high):
+            starts.append(block_starts)
+            energies.append(np.einsum('ij,ij->i', spectra, spectra))
+        return np.concatenate(starts), np.concatenate(energies)
+
+    def top_frequencies(self, n=10, k=10, start_sample=None, end_sample=None, counter=None):
+        """Return the n most common frequencies among the k most prominent ones of every window.
+
+        Every window counts a frequency in whole Hz at most once, also where several bins round to it.
+        """
+        if counter is None:
+            counter = FrequencyCounter()
+        for _, spectra in self.iter_blocks(start_sample, end_sample):
+            # Only the first half of the spectrum, like top_frequency_table
+            counter.update(top_k_frequencies(spectra[:, :self.window_size // 2], self.sample_rate,
+                                             self.window_size, k))
+        return counter.most_common(n)
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,120 @@
+import numpy as np
+
+
+class RunningStats:
+    """Running per-bin mean and variance of spectra (Welford/Chan), updated in batches and mergeable.
+
+    Batches are reduced in the precision of the spectra, the combined statistics are always float64.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = None
+        self.m2 = None
+
+    def update(self, values):
+        """Add a batch of spectra (one row per window) to the statistics.
+
+        Batches of several channels (channels, windows, bins) give statistics per channel and bin.
+        """
+        values = np.atleast_2d(values)
+        if values.shape[-2] == 0:
+            return self
+
+        # Statistics of the batch on its own, combined with the running ones afterwards
+        batch_mean = values.mean(axis=-2)
+        batch_m2 = ((values - np.expand_dims(batch_mean, -2)) ** 2).sum(axis=-2)
+        self._combine(values.shape[-2], batch_mean, batch_m2)
+        return self
+
+    def merge(self, other):
+        """Merge the statistics of another accumulator into this one."""
+        if other.count > 0:
+            self._combine(other.count, other.mean, other.m2)
+        return self
+
+    def _combine(self, count, mean, m2):
+        """Combine partial statistics with the running ones (Chan et al.)."""
+        if self.count == 0:
+            # The running sums are kept in double precision, also for float32 spectra
+            self.count, self.mean, self.m2 = count, mean.astype(np.float64), m2.astype(np.float64)
+            return
+
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * (count / total)
+        self.m2 += m2 + delta ** 2 * (self.count * count / total)
+        self.count = total
+
+    def variance(self):
+        """Return the population variance of every bin (like np.var)."""
+        if self.count == 0:
+            raise ValueError('no spectra have been added')
+        return self.m2 / self.count
+
+    def std(self):
+        """Return the population standard deviation of every bin (like np.std)."""
+        return np.sqrt(self.variance())
+
+
+class RollingStats:
+    """Per-bin mean and variance of the last history spectra of a stream, with a fixed amount of memory.
+
+    Sums and sums of squares are updated per spectrum and recomputed from the buffered spectra once per history
+    updates, so rounding errors of the subtractions do not accumulate.
+    """
+
+    def __init__(self, history=100):
+        self.history = history
+        self.count = 0
+        self.spectra = None  # Ring of the last history spectra
+        self.pos = 0
+        self.sum = None
+        self.sum_sq = None
+        self._updates = 0
+
+    def update(self, values):
+        """Add a batch of spectra (one row per window), dropping the oldest ones."""
+        values = np.atleast_2d(values)
+        if self.spectra is None:
+            self.spectra = np.zeros((self.history, values.shape[1]))
+            self.sum = np.zeros(values.shape[1])
+            self.sum_sq = np.zeros(values.shape[1])
+
+        for row in values[-self.history:]:
+            if self.count == self.history:
+                oldest = self.spectra[self.pos]
+                self.sum -= oldest
+                self.sum_sq -= oldest ** 2
+            else:
+                self.count += 1
+            self.spectra[self.pos] = row
+            self.sum += row
+            self.sum_sq += row ** 2
+            self.pos = (self.pos + 1) % self.history
+
+            self._updates += 1
+            if self._updates == self.history:
+                self.sum = self.spectra[:self.count].sum(axis=0)
+                self.sum_sq = (self.spectra[:self.count] ** 2).sum(axis=0)
+                self._updates = 0
+        return self
+
+    @property
+    def mean(self):
+        if self.count == 0:
+            raise ValueError('no spectra have been added')
+        return self.sum / self.count
+
+    def variance(self):
+        """Return the population variance of every bin over the last history spectra."""
+        mean = self.mean
+        return np.maximum(self.sum_sq / self.count - mean ** 2, 0)
+
+    def std(self):
+        return np.sqrt(self.variance())
+
+
+def batch_statistics(starts, spectra):
+    """Return the statistics of one batch of spectra, to be merged in order of the batches."""
+    return RunningStats().update(spectra)
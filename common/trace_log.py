@@ -0,0 +1,130 @@
+import json
+import os
+import struct
+
+import numpy as np
+
+MAGIC = b'HCTRACE1'
+DEFAULT_COLUMNS = ('start', 'current', 'peak', 'rss', 'elapsed_us', 'windows')
+CHUNK_ROWS = 1 << 16
+MISSING = -1  # Stored for values that could not be measured (None)
+
+
+def _normalize(samples, num_columns):
+    """Return the samples as an int64 matrix with one column per measured value."""
+    rows = [[MISSING if value is None else value for value in row] for row in samples]
+    if not rows:
+        return np.empty((0, num_columns), dtype=np.int64)
+    return np.asarray(rows, dtype=np.int64).reshape(len(rows), -1)
+
+
+def write_trace(path, samples, columns=None, **metadata):
+    """Write memory samples ([start, current, peak, ...] rows) as a columnar trace file.
+
+    The file starts with a magic number and a small JSON header (column names, row count and metadata such as
+    platform, window_size and offset), followed by one contiguous little-endian int64 array per column.
+    """
+    table = _normalize(samples, len(columns) if columns is not None else len(DEFAULT_COLUMNS))
+    if columns is None:
+        columns = DEFAULT_COLUMNS[:table.shape[1]]
+    if table.shape[1] != len(columns):
+        raise ValueError(f'samples have {table.shape[1]} values per row, but {len(columns)} columns are named')
+
+    header = json.dumps({'columns': list(columns), 'dtype': '<i8', 'rows': len(table),
+                         'metadata': metadata}).encode()
+    # Pad the header so the columns start 8-byte aligned
+    header += b' ' * (-(len(MAGIC) + 4 + len(header)) % 8)
+
+    with open(path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<I', len(header)))
+        f.write(header)
+        # Column after column, so every column can be mapped on its own
+        f.write(np.ascontiguousarray(table.T, dtype='<i8').tobytes())
+
+
+class TraceLog:
+    """Memory trace file with its columns mapped into memory.
+
+    Columns are accessed by name (trace['start']) and are only read from disk as far as they are used.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f'{path} is not a trace file')
+            header_size, = struct.unpack('<I', f.read(4))
+            header = json.loads(f.read(header_size))
+
+        self.columns = tuple(header['columns'])
+        self.rows = header['rows']
+        self.metadata = header['metadata']
+        data_offset = len(MAGIC) + 4 + header_size
+        if self.rows:
+            self._data = np.memmap(path, dtype=header['dtype'], mode='r', offset=data_offset,
+                                   shape=(len(self.columns), self.rows))
+        else:
+            self._data = np.empty((len(self.columns), 0), dtype=header['dtype'])
+
+    def __len__(self):
+        return self.rows
+
+    def __getitem__(self, name):
+        return self._data[self.columns.index(name)]
+
+    def iter_chunks(self, chunk_rows=CHUNK_ROWS):
+        """Yield dictionaries of column name to the next chunk_rows values."""
+        for first in range(0, self.rows, chunk_rows):
+            yield {name: self._data[i, first:first + chunk_rows] for i, name in enumerate(self.columns)}
+
+    def close(self):
+        self._data = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def read_trace(path):
+    """Open a trace file written by write_trace."""
+    return TraceLog(path)
+
+
+def metadata_from_name(path):
+    """Guess platform, window_size and offset from a log name like windows_44100_441.json."""
+    tokens = os.path.splitext(os.path.basename(path))[0].split('_')
+    metadata = {'platform': tokens[0]}
+    if len(tokens) >= 3 and tokens[-2].isdigit() and tokens[-1].isdigit():
+        metadata['window_size'] = int(tokens[-2])
+        metadata['offset'] = int(tokens[-1])
+    return metadata
+
+
+def convert_json_log(json_path, trace_path=None, **metadata):
+    """Convert a JSON memory log into a trace file next to it and return the path of the trace file.
+
+    Metadata that is not given is taken from the file name.
+    """
+    if trace_path is None:
+        trace_path = os.path.splitext(json_path)[0] + '.trace'
+
+    with open(json_path, 'r') as f:
+        samples = json.load(f)
+
+    write_trace(trace_path, samples, **{**metadata_from_name(json_path), **metadata})
+    return trace_path
+
+
+def load_log(path):
+    """Return the columns (name to array) and metadata of a trace file or a JSON memory log."""
+    if path.endswith('.json'):
+        with open(path, 'r') as f:
+            table = _normalize(json.load(f), len(DEFAULT_COLUMNS))
+        columns = DEFAULT_COLUMNS[:table.shape[1]]
+        return {name: table[:, i] for i, name in enumerate(columns)}, metadata_from_name(path)
+
+    trace = read_trace(path)
+    return {name: trace[name] for name in trace.columns}, trace.metadata
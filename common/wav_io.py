@@ -0,0 +1,348 @@
+import struct
+from collections import namedtuple
+
+import numpy as np
+
+# Number of windows that are read and handed on together
+BATCH_SIZE = 32
+
+
+WavFormat = namedtuple('WavFormat', 'num_channels sample_rate sample_width is_float')
+# Same fields as wave.Wave_read.getparams()
+WavParams = namedtuple('WavParams', 'nchannels sampwidth framerate nframes comptype compname')
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+
+def read_wav_header(stream, name='stream'):
+    """Read the RIFF header of a PCM (8, 16, 24, 32 bit) or float (32, 64 bit) WAV file up to the samples.
+
+    The header is only read forward, so stream can also be a pipe. Returns the WavFormat and the size of the data
+    chunk in bytes as given in the header.
+    """
+    header = stream.read(12)
+    if len(header) < 12:
+        raise ValueError(f'{name} is not a WAV file')
+    riff, _, wave_id = struct.unpack('<4sI4s', header)
+    if riff != b'RIFF' or wave_id != b'WAVE':
+        raise ValueError(f'{name} is not a WAV file')
+
+    fmt = None
+    while True:
+        header = stream.read(8)
+        if len(header) < 8:
+            raise ValueError(f'{name} has no data chunk')
+        chunk_id, chunk_size = struct.unpack('<4sI', header)
+
+        # Chunks are padded to an even number of bytes
+        if chunk_id == b'fmt ':
+            fmt = stream.read(chunk_size + chunk_size % 2)
+        elif chunk_id == b'data':
+            if fmt is None:
+                raise ValueError(f'{name} has no fmt chunk before the data')
+            break
+        else:
+            stream.read(chunk_size + chunk_size % 2)
+
+    format_tag, num_channels, sample_rate, _, _, bits_per_sample = struct.unpack('<HHIIHH', fmt[:16])
+    if format_tag == WAVE_FORMAT_EXTENSIBLE and len(fmt) >= 26:
+        # The actual format is in the first two bytes of the sub format GUID
+        format_tag, = struct.unpack('<H', fmt[24:26])
+
+    if format_tag == WAVE_FORMAT_PCM and bits_per_sample in (8, 16, 24, 32):
+        is_float = False
+    elif format_tag == WAVE_FORMAT_IEEE_FLOAT and bits_per_sample in (32, 64):
+        is_float = True
+    else:
+        raise ValueError(f'{name} has an unsupported sample format ({format_tag}, {bits_per_sample} bit)')
+
+    return WavFormat(num_channels, sample_rate, bits_per_sample // 8, is_float), chunk_size
+
+
+def read_wav_layout(file_path):
+    """Return the WavFormat, the offset and the size in bytes of the samples of a WAV file.
+
+    Streamed files may leave the size of the data chunk open, the samples then reach to the end of the file.
+    """
+    with open(file_path, 'rb') as f:
+        wav_format, chunk_size = read_wav_header(f, file_path)
+        data_offset = f.tell()
+        file_size = f.seek(0, 2)
+    return wav_format, data_offset, min(chunk_size, file_size - data_offset)
+
+
+def sample_dtype(wav_format):
+    """Return the numpy type of the stored samples, None for 24 bit samples, which have no numpy type."""
+    if wav_format.is_float:
+        return np.dtype(f'<f{wav_format.sample_width}')
+    return {1: np.dtype('u1'), 2: np.dtype('<i2'), 3: None, 4: np.dtype('<i4')}[wav_format.sample_width]
+
+
+def sample_scale(wav_format):
+    """Return scale and zero point that map stored samples to range [-1, 1]: (sample - zero) * scale."""
+    if wav_format.is_float:
+        return 1.0, 0
+    if wav_format.sample_width == 1:
+        # 8 bit samples are unsigned
+        return 1 / (2 ** 7), 128
+    return 1 / (2 ** (8 * wav_format.sample_width - 1)), 0
+
+
+def mapping_error(wav_format):
+    """Return why the samples of a format cannot be memory-mapped by WavMemmap, None if they can."""
+    stored = sample_dtype(wav_format)
+    if stored is None:
+        return '24 bit samples, which cannot be mapped into memory'
+    if stored == np.uint8:
+        return 'unsigned 8 bit samples, which cannot be normalized by a scale'
+    return None
+
+
+def decode_frames(data, wav_format, dtype=np.float64, channel=None):
+    """Decode interleaved frames into a contiguous (channels, samples) array normalized to range [-1, 1].
+
+    With channel given, only that channel is decoded and returned as contiguous 1d array.
+    """
+    frame_bytes = wav_format.sample_width * wav_format.num_channels
+    num_frames = len(data) // frame_bytes
+    data = data[:num_frames * frame_bytes]
+
+    stored = sample_dtype(wav_format)
+    if stored is None:
+        # 24 bit: the three bytes go into the upper bytes of an int32, shifting back keeps the sign
+        padded = np.zeros((num_frames * wav_format.num_channels, 4), dtype=np.uint8)
+        padded[:, 1:] = np.frombuffer(data, dtype=np.uint8).reshape(-1, 3)
+        samples = padded.view('<i4')[:, 0] >> 8
+    else:
+        samples = np.frombuffer(data, dtype=stored)
+
+    # Frames as rows, the transposed view is written contiguously per channel
+    frames = samples.reshape(num_frames, wav_format.num_channels)
+    selected = frames.T if channel is None else frames[:, channel]
+    scale, zero = sample_scale(wav_format)
+
+    out = np.empty(selected.shape, dtype=dtype)
+    if zero:
+        np.subtract(selected, zero, out=out, dtype=dtype)
+        selected = out
+    if scale != 1.0:
+        np.multiply(selected, scale, out=out, dtype=dtype)
+    elif selected is not out:
+        out[...] = selected
+    return out
+
+
+class WavReader:
+    """Reads and decodes the frames of a WAV file block by block, with the interface of wave.Wave_read.
+
+    Unlike the wave module, float WAV files and the extensible header are supported as well.
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.format, self.data_offset, data_size = read_wav_layout(file_path)
+        self.file = open(file_path, 'rb')
+        self.frame_bytes = self.format.sample_width * self.format.num_channels
+        self.num_frames = data_size // self.frame_bytes
+        self.setpos(0)
+
+    def getnchannels(self):
+        return self.format.num_channels
+
+    def getsampwidth(self):
+        return self.format.sample_width
+
+    def getframerate(self):
+        return self.format.sample_rate
+
+    def getnframes(self):
+        return self.num_frames
+
+    def getparams(self):
+        return WavParams(self.format.num_channels, self.format.sample_width, self.format.sample_rate,
+                         self.num_frames, 'NONE', 'not compressed')
+
+    def tell(self):
+        return self.position
+
+    def setpos(self, position):
+        self.position = max(0, min(position, self.num_frames))
+        self.file.seek(self.data_offset + self.position * self.frame_bytes)
+
+    def readframes(self, num_frames):
+        """Read up to num_frames frames as raw bytes."""
+        num_frames = max(0, min(num_frames, self.num_frames - self.position))
+        data = self.file.read(num_frames * self.frame_bytes)
+        self.position += len(data) // self.frame_bytes
+        return data
+
+    def read(self, num_frames, dtype=np.float64, channel=None):
+        """Read up to num_frames frames decoded as (channels, samples), or only one channel."""
+        return decode_frames(self.readframes(num_frames), self.format, dtype, channel)
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def read_wav_params(file_path):
+    """Return the parameters of a WAV file without reading the audio data."""
+    with WavReader(file_path) as wav_file:
+        return wav_file.getparams()
+
+
+def audio_length(audio_data):
+    """Return the number of samples of an array (per channel), a WavMemmap or the WAV file at the given path."""
+    if isinstance(audio_data, str):
+        return read_wav_params(audio_data).nframes
+    if isinstance(audio_data, WavMemmap):
+        return len(audio_data)
+    return np.shape(audio_data)[-1]
+
+
+def audio_channels(audio_data):
+    """Return the number of channels of an array (channels, samples), a WavMemmap or a WAV file."""
+    if isinstance(audio_data, str):
+        return read_wav_params(audio_data).nchannels
+    if isinstance(audio_data, WavMemmap):
+        return audio_data.num_channels
+    return 1 if np.ndim(audio_data) == 1 else np.shape(audio_data)[0]
+
+
+def read_samples(wav_file, num_frames, dtype=np.float64, multichannel=False):
+    """Read up to num_frames frames and return the first channel normalized to range [-1, 1].
+
+    With multichannel, all channels are returned as contiguous (channels, samples) array. Samples of up to 24 bit
+    are exact in float32 as well, so dtype=np.float32 loses no precision for them.
+    """
+    return wav_file.read(num_frames, dtype, channel=None if multichannel else 0)
+
+
+def load_wav_file(file_path, dtype=np.float64, multichannel=False):
+    """Load a WAV file and return the audio data (first channel or (channels, samples)) and sampling rate."""
+    with WavReader(file_path) as wav_file:
+        return read_samples(wav_file, wav_file.getnframes(), dtype, multichannel), wav_file.getframerate()
+
+
+class WavMemmap:
+    """Read-only memory-mapped view of the samples of a WAV file.
+
+    Only the RIFF header is parsed when opening, samples are normalized per section when they are accessed. 24 bit
+    samples have no numpy type and cannot be mapped, WavReader decodes them.
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.format, data_offset, data_size = read_wav_layout(file_path)
+        self.num_channels = self.format.num_channels
+        self.sample_rate = self.format.sample_rate
+        error = mapping_error(self.format)
+        if error is not None:
+            raise ValueError(f'{file_path} has {error}')
+        # Factor that normalizes the stored samples to range [-1, 1]
+        self.scale = sample_scale(self.format)[0]
+
+        # Frames as rows, channels as columns, directly on top of the file
+        num_frames = data_size // (self.format.sample_width * self.num_channels)
+        self.frames = np.memmap(file_path, dtype=sample_dtype(self.format), mode='r', offset=data_offset,
+                                shape=(num_frames, self.num_channels))
+
+    def __len__(self):
+        return len(self.frames)
+
+    def channel(self, channel=0):
+        """Return the stored samples of one channel as a view without copying."""
+        return self.frames[:, channel]
+
+    def channels(self):
+        """Return the stored samples as (channels, samples) view without copying."""
+        return self.frames.T
+
+    def section(self, start, end, channel=0, dtype=np.float64):
+        """Return the samples of one channel between start and end normalized to range [-1, 1]."""
+        return np.multiply(self.frames[start:end, channel], self.scale, dtype=dtype)
+
+
+class RingBuffer:
+    """Fixed size buffer holding the most recent samples of a stream, optionally with several channels."""
+
+    def __init__(self, size, dtype=np.float64, num_channels=None):
+        shape = size if num_channels is None else (num_channels, size)
+        self.data = np.zeros(shape, dtype=dtype)
+        self.pos = 0  # Index of the oldest sample
+
+    def push(self, samples):
+        """Overwrite the oldest samples with the given ones (along the last axis)."""
+        size = self.data.shape[-1]
+        samples = samples[..., -size:]
+        count = samples.shape[-1]
+        first = min(count, size - self.pos)
+        self.data[..., self.pos:self.pos + first] = samples[..., :first]
+        self.data[..., :count - first] = samples[..., first:]
+        self.pos = (self.pos + count) % size
+
+    def copy_to(self, out):
+        """Copy the buffered samples in chronological order into out."""
+        tail = self.data.shape[-1] - self.pos
+        out[..., :tail] = self.data[..., self.pos:]
+        out[..., tail:] = self.data[..., :self.pos]
+
+
+def wav_window_batches(file_path, window_size, offset, batch_size=BATCH_SIZE, acquire=None, dtype=np.float64,
+                       multichannel=False):
+    """Yield the start indices and batches of overlapping windows read block by block from a WAV file.
+
+    Only one window plus one batch is kept in memory. The start indices of every batch are a new array, the
+    yielded batch array is reused for the next batch, unless acquire is given: it is then called for the
+    (batch_size, window_size) array of every batch. With multichannel, batches have the shape
+    (channels, batch_size, window_size).
+    """
+    with WavReader(file_path) as wav_file:
+        num_channels = wav_file.getnchannels() if multichannel else None
+        shape = (batch_size, window_size) if num_channels is None else (num_channels, batch_size, window_size)
+        batch = np.empty(shape, dtype=dtype) if acquire is None else acquire()
+        starts = np.empty(batch_size, dtype=np.int64)
+        ring = RingBuffer(window_size, dtype, num_channels)
+
+        # Fill the ring buffer with the first window
+        samples = read_samples(wav_file, window_size, dtype, multichannel)
+        if samples.shape[-1] < window_size:
+            return
+        ring.push(samples)
+
+        start = 0
+        count = 0
+        while True:
+            ring.copy_to(batch[..., count, :])
+            starts[count] = start
+            count += 1
+            if count == batch_size:
+                yield starts[:count].copy(), batch[..., :count, :]
+                count = 0
+                if acquire is not None:
+                    batch = acquire()
+
+            # Skip the samples between two windows that do not overlap
+            skip = offset - window_size
+            if skip > 0:
+                if wav_file.tell() + skip > wav_file.getnframes():
+                    break
+                wav_file.setpos(wav_file.tell() + skip)
+
+            # Read one hop into the ring buffer
+            hop = min(offset, window_size)
+            samples = read_samples(wav_file, hop, dtype, multichannel)
+            if samples.shape[-1] < hop:
+                break
+            ring.push(samples)
+            start += offset
+
+        if count > 0:
+            yield starts[:count].copy(), batch[..., :count, :]